@@ -1,8 +1,7 @@
 import argparse
 import sys
 from struct import *
-from server import main as serverMain
-from client import main as clientMain
+from drtp.metrics import INFO, QUIET
 
 #Method to check the given port
 def checkPort(port):
@@ -58,14 +57,37 @@ def main ():
 
     parser.add_argument('-s', '--server', action='store_true', help="Invoke as the server")
     parser.add_argument('-c', '--client', action='store_true', help="Invoke as the client")
-    parser.add_argument('-f', '--file', nargs='?', help='Enter the filename')
+    parser.add_argument('-f', '--file', nargs='+', action='extend', help='Enter the filename (several files or a directory are sent at the same time)')
+    parser.add_argument('--stripes', type=int, default=1, help='Client: send one file over this many connections at the same time')
+    parser.add_argument('--parallel', type=int, default=32, help='Client: the most files sent at the same time')
     parser.add_argument('-i', '--serverIP', help='Enter the server IP')
     parser.add_argument('-p', '--serverPort', type=int, help='Enter the server port number')
-    parser.add_argument('-w', '--window', type=int, default=3, help='Sliding window size')
-    parser.add_argument('-d', '--drop', nargs='?', default=0, help='Enter wanted drops')
+    parser.add_argument('-w', '--window', type=int, default=3, help='Sliding window size (the largest window with --cc reno)')
+    parser.add_argument('--cc', choices=['none', 'reno'], default='none', help='Congestion control: a fixed window (none) or slow start and AIMD (reno)')
+    parser.add_argument('-a', '--arq', choices=['gbn', 'sr'], default='gbn', help='Retransmission mode: Go-Back-N (gbn) or Selective Repeat (sr)')
+    parser.add_argument('--dupacks', type=int, default=3, help='Duplicate ACKs before a fast retransmit (0 turns it off)')
+    parser.add_argument('-m', '--mss', type=int, help='Bytes of data in each packet (client: wanted size, default 994; server: the largest allowed)')
+    parser.add_argument('--probe', action='store_true', help='Client: find the largest packet that gets through without fragmentation and use it')
+    parser.add_argument('--compress', choices=['zlib', 'lzma', 'zstd'], help='Client: compress the data on the way if the server knows the method (zstd needs the zstandard package)')
+    parser.add_argument('--level', type=int, help='Client: the compression level (zlib 0-9, lzma 0-9, zstd 1-22)')
+    parser.add_argument('--pace', action='store_true', help='Client: spread the packets of the window over the RTT instead of sending them all at once')
+    parser.add_argument('--rate', type=float, help='Client: send at most this many Mbit/s (shared by all the files and stripes)')
+    parser.add_argument('--rcvbuf', type=int, help='Server: size of the socket receive buffer in bytes')
+    parser.add_argument('--sndbuf', type=int, help='Server: size of the socket send buffer in bytes')
+    parser.add_argument('--no-batch', action='store_true', help='Send and receive one packet per system call instead of in batches')
+    parser.add_argument('--workers', type=int, default=1, help='Server: number of processes sharing the port (SO_REUSEPORT)')
+    parser.add_argument('-o', '--output', help='Server: file or directory to save the received file in')
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='Print more (-v prints a line for every packet)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print errors and results')
+    parser.add_argument('--stats', help="Write the transfer metrics as JSON lines to this file ('-' for the terminal)")
+    parser.add_argument('--stats-interval', type=float, default=0, help='Also write the metrics every this many seconds during a transfer')
+    parser.add_argument('-d', '--drop', type=float, nargs='?', const=0.1, default=0, help='Server: share of the data packets to drop on purpose (0.1 without a value)')
+    parser.add_argument('--seed', type=int, help='Server: seed for the random drops, so the same packets are dropped every time')
 
 
     args = parser.parse_args()
+    #How much to print: only errors and results, what happens to the connections, or every packet
+    verbosity = QUIET if args.quiet else INFO + args.verbose
 
     #Checking the argumentline if the given ip and port is valid,
     #if the user uses both client and server at the same time or
@@ -73,7 +95,9 @@ def main ():
     if args.server:
         #If the argumentline get's through the check then we can connect
         if argumentlineCheck('server', args.serverIP, args.serverPort):
-            serverMain(args.serverIP, args.serverPort, args.drop)
+            #Only the side we run is imported, so the program starts faster
+            from drtp.receiver import main as serverMain
+            serverMain(args.serverIP, args.serverPort, args.drop, args.output, args.mss, not args.no_batch, args.workers, verbosity, args.stats, args.stats_interval, args.seed, args.rcvbuf, args.sndbuf)
         else:
             print('Couldnt connect to server due to missing/wrong arguments')
     elif args.client:
@@ -84,10 +108,11 @@ def main ():
             if args.file == None:
                 print('No file specified')
             else: 
-                print(f'File {args.file} specified')
+                print(f'File {", ".join(args.file)} specified')
             #Sending the IP, Port and the given jpeg file
             #as a bytes string to the client to handle
-            clientMain(args.serverIP, args.serverPort, args.file, args.window)
+            from drtp.sender import main as clientMain
+            clientMain(args.serverIP, args.serverPort, args.file, args.window, args.arq, args.dupacks, args.cc, args.mss, args.probe, not args.no_batch, args.parallel, args.stripes, verbosity, args.stats, args.stats_interval, args.compress, args.level, args.pace, args.rate)
         else:
             print('Couldnt connect to client due to missing/wrong arguments')
     elif args.server & args.client:
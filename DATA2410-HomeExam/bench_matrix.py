@@ -0,0 +1,190 @@
+import argparse
+import filecmp
+import itertools
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+#Running the client and server in application.py through the impairment proxy for
+#every combination of window size, packet size and loss rate, and reporting the
+#throughput, completion time and retransmission overhead of each. Save the results
+#with --json and compare a later run against them with --baseline to find out if a
+#change to the protocol made it slower.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+#How long we give the server and the proxy to start before the client is started
+STARTUP_TIME = 0.5
+
+#A port nobody uses right now
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+#Starting one of the programs in this directory
+def start(program, *arguments):
+    return subprocess.Popen([sys.executable, program] + [str(argument) for argument in arguments],
+                            cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+#Stopping a program the same way as Ctrl+C, so it can clean up
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+#Sending the file once with the given settings. Returns the result of the run
+def run_case(file_name, window, mss, loss, seed, args, workdir):
+    output = os.path.join(workdir, 'out')
+    shutil.rmtree(output, ignore_errors=True)
+    os.mkdir(output)
+    client_stats = os.path.join(workdir, 'client.jsonl')
+    if os.path.exists(client_stats):
+        os.remove(client_stats)
+    server_port = free_port()
+    proxy_port = free_port()
+    server = start('application.py', '-s', '-i', '127.0.0.1', '-p', server_port, '-o', output, '-q')
+    proxy = start('impairment.py', '-p', server_port, '-l', proxy_port, '--loss', loss, '--delay', args.delay,
+                  '--jitter', args.jitter, '--rate', args.rate, '--seed', seed)
+    result = {'window': window, 'mss': mss, 'loss': loss, 'seed': seed, 'ok': False}
+    try:
+        time.sleep(STARTUP_TIME)
+        client = start('application.py', '-c', '-i', '127.0.0.1', '-p', proxy_port, '-f', file_name, '-w', window,
+                       '-m', mss, '-a', args.arq, '--cc', args.cc, '-q', '--stats', client_stats)
+        try:
+            client.wait(args.timeout)
+        except subprocess.TimeoutExpired:
+            stop(client)
+            result['error'] = 'timed out'
+            return result
+    finally:
+        stop(proxy)
+        stop(server)
+
+    #The client writes its metrics as the last line of the stats file
+    try:
+        with open(client_stats) as file:
+            record = json.loads(file.readlines()[-1])
+    except (OSError, IndexError, ValueError):
+        result['error'] = 'no stats from the client'
+        return result
+    received = os.path.join(output, os.path.basename(file_name))
+    result['ok'] = record['completed'] and os.path.exists(received) and filecmp.cmp(file_name, received, shallow=False)
+    result['seconds'] = record['elapsed']
+    result['mbps'] = record['goodput_mbps']
+    #How many packets were sent again for every packet of the file
+    data_packets = record['packets_sent'] - record['retransmissions']
+    result['retransmission_overhead'] = record['retransmissions'] / data_packets if data_packets else 0
+    result['timeouts'] = record['timeouts']
+    return result
+
+#Running every combination repeat times, and keeping the run with the median time
+def run_matrix(file_name, args, workdir):
+    results = []
+    for window, mss, loss in itertools.product(args.windows, args.mss, args.loss):
+        runs = [run_case(file_name, window, mss, loss, args.seed + i, args, workdir) for i in range(args.repeat)]
+        good = [run for run in runs if run['ok']]
+        if good:
+            median = statistics.median_low(run['seconds'] for run in good)
+            result = next(run for run in good if run['seconds'] == median)
+        else:
+            result = runs[0]
+        result['runs'] = len(runs)
+        result['failed_runs'] = len(runs) - len(good)
+        print_result(result)
+        results.append(result)
+    return results
+
+def print_header():
+    print("{:>6} {:>6} {:>6} {:>9} {:>9} {:>11} {:>9}  {}".format("window", "mss", "loss", "seconds", "Mbps", "retransmit", "timeouts", "result"))
+
+def print_result(result):
+    status = "ok" if result['ok'] else result.get('error', 'wrong file')
+    if result['ok'] and result['failed_runs']:
+        status += " ({} of {} runs failed)".format(result['failed_runs'], result['runs'])
+    if 'seconds' not in result:
+        print("{:>6} {:>6} {:>6}  {}".format(result['window'], result['mss'], result['loss'], status))
+        return
+    print("{:>6} {:>6} {:>6} {:>9.3f} {:>9.2f} {:>10.1f}% {:>9}  {}".format(
+        result['window'], result['mss'], result['loss'], result['seconds'], result['mbps'],
+        result['retransmission_overhead'] * 100, result['timeouts'], status))
+
+#Comparing the throughput against an earlier run. Returns the cases that got slower
+#than the tolerance allows, or that worked before and fail now
+def find_regressions(results, baseline, tolerance):
+    before = {(old['window'], old['mss'], old['loss']): old for old in baseline}
+    regressions = []
+    for result in results:
+        old = before.get((result['window'], result['mss'], result['loss']))
+        if old is None or not old['ok']:
+            continue
+        if not result['ok'] or result['mbps'] < old['mbps'] * (1 - tolerance):
+            regressions.append((result, old))
+    return regressions
+
+def numbers(kind):
+    return lambda text: [kind(value) for value in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='DRTP benchmark over a matrix of window sizes, packet sizes and loss rates')
+    parser.add_argument('-f', '--file', help='File to send (a random file is made if not given)')
+    parser.add_argument('--size', type=float, default=2, help='Size in MB of the random file')
+    parser.add_argument('--windows', type=numbers(int), default=[16, 64], help='Window sizes, separated by commas')
+    parser.add_argument('--mss', type=numbers(int), default=[994, 8972], help='Bytes of data per packet, separated by commas')
+    parser.add_argument('--loss', type=numbers(float), default=[0, 0.01, 0.05], help='Loss rates in each direction, separated by commas')
+    parser.add_argument('--delay', type=float, default=5, help='Delay in ms in each direction')
+    parser.add_argument('--jitter', type=float, default=0, help='Jitter in ms')
+    parser.add_argument('--rate', type=float, default=0, help='Bandwidth limit in Mbit/s (0 for no limit)')
+    parser.add_argument('-a', '--arq', choices=['gbn', 'sr'], default='sr', help='Retransmission mode')
+    parser.add_argument('--cc', choices=['none', 'reno'], default='reno', help='Congestion control')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs of every combination (the median is reported)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the loss of the first run')
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds before a transfer is given up')
+    parser.add_argument('--json', help='Save the results in this file')
+    parser.add_argument('--baseline', help='Compare against results saved with --json earlier')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='How much slower than the baseline a case may be (0.2 is 20%%)')
+    args = parser.parse_args()
+    #The client is run from this folder, while the file is compared and measured from
+    #where we are run, so a relative file name has to be made absolute first
+    if args.file:
+        args.file = os.path.abspath(args.file)
+
+    workdir = tempfile.mkdtemp(prefix='drtp-bench-')
+    try:
+        file_name = args.file
+        if not file_name:
+            file_name = os.path.join(workdir, 'random.bin')
+            with open(file_name, 'wb') as file:
+                remaining = int(args.size * 1000000)
+                while remaining > 0:
+                    file.write(os.urandom(min(remaining, 1000000)))
+                    remaining -= 1000000
+        print("{} bytes, {} and {}, {} ms delay each way".format(os.path.getsize(file_name), args.arq, args.cc, args.delay))
+        print_header()
+        results = run_matrix(file_name, args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for result, old in regressions:
+            print("Slower than the baseline: window {} mss {} loss {}: {} Mbps, was {:.2f} Mbps".format(
+                result['window'], result['mss'], result['loss'], "{:.2f}".format(result['mbps']) if 'mbps' in result else "failed", old['mbps']))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(args.baseline))
+
+if __name__ == '__main__':
+    main()
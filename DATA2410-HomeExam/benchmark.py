@@ -0,0 +1,241 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import socket
+import struct
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from drtp import batchio
+from drtp.codec import (HEADER_SIZES, MAX_PAYLOAD, PAYLOAD_SIZE, create_packet, header_format_v2, header_values, pack_packet_into,
+                        parse_checked, parse_packet)
+from drtp.sender import map_file, release_pages, send_segment, RELEASE_CHUNK
+
+#Benchmarks for the parts of the protocol that decide how fast we can go.
+#Every benchmark runs in its own process so the peak memory use (RSS)
+#of one of them doesn't hide the other.
+
+#How many packets the allocation measurement looks at
+ALLOCATION_SAMPLES = 2000
+#How many packets the codec benchmark packs and parses for every header version
+CODEC_PACKETS = 200000
+
+#The old way of sending: reading every block into a new bytes object, putting the
+#header in front of it in another new bytes object, and keeping that in the window
+#until it is acknowledged, so it can be resent
+def copy_sender(sock, file_name, window_size, trace=False):
+    window = {}
+    allocated = 0
+    seq_num = 1
+    with open(file_name, "rb") as file:
+        while True:
+            if trace and seq_num <= ALLOCATION_SAMPLES:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            data = file.read(PAYLOAD_SIZE)
+            if not data:
+                break
+            packet = create_packet(seq_num, 0, 0, data, 2)
+            sock.send(packet)
+            window[seq_num] = packet
+            #Acknowledging the oldest packet as soon as the window is full
+            window.pop(seq_num - window_size, None)
+            if trace and seq_num <= ALLOCATION_SAMPLES:
+                allocated += tracemalloc.get_traced_memory()[1] - before
+            seq_num += 1
+    return seq_num - 1, allocated
+
+#The memory-mapped way of sending: the header and a slice of the map are
+#given to sendmsg, and the window only holds the length of each packet
+def mmap_sender(sock, file_name, window_size, trace=False):
+    window = {}
+    allocated = 0
+    seq_num = 1
+    released = 0
+    with open(file_name, "rb") as file, map_file(file) as (mm, view):
+        last_seq_num = (len(view) + PAYLOAD_SIZE - 1) // PAYLOAD_SIZE
+        header = bytearray(HEADER_SIZES[2])
+        while seq_num <= last_seq_num:
+            if trace and seq_num <= ALLOCATION_SAMPLES:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            window[seq_num] = send_segment(sock, view, seq_num, 2, PAYLOAD_SIZE, header)
+            window.pop(seq_num - window_size, None)
+            if trace and seq_num <= ALLOCATION_SAMPLES:
+                allocated += tracemalloc.get_traced_memory()[1] - before
+            acked_bytes = max(seq_num - window_size, 0) * PAYLOAD_SIZE
+            if mm is not None and acked_bytes - released >= RELEASE_CHUNK:
+                released = release_pages(mm, released, acked_bytes)
+            seq_num += 1
+    return seq_num - 1, allocated
+
+#The memory-mapped way of sending, but with the packets put in a batch that
+#is sent with one system call (sendmmsg) when it is full
+def batch_sender(sock, file_name, window_size, trace=False):
+    window = {}
+    allocated = 0
+    seq_num = 1
+    released = 0
+    with open(file_name, "rb") as file, map_file(file) as (mm, view):
+        batch = batchio.SendBatch(sock, view, header_format_v2)
+        last_seq_num = (len(view) + PAYLOAD_SIZE - 1) // PAYLOAD_SIZE
+        while seq_num <= last_seq_num:
+            if trace and seq_num <= ALLOCATION_SAMPLES:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            offset = (seq_num - 1) * PAYLOAD_SIZE
+            length = min(PAYLOAD_SIZE, len(view) - offset)
+            batch.add(offset, length, *header_values(seq_num, 0, 0, length, 2))
+            window[seq_num] = length
+            window.pop(seq_num - window_size, None)
+            if trace and seq_num <= ALLOCATION_SAMPLES:
+                allocated += tracemalloc.get_traced_memory()[1] - before
+            acked_bytes = max(seq_num - window_size, 0) * PAYLOAD_SIZE
+            if mm is not None and acked_bytes - released >= RELEASE_CHUNK:
+                #The packets up to here have been given to the kernel before we let the pages go
+                batch.flush()
+                released = release_pages(mm, released, acked_bytes)
+            seq_num += 1
+        batch.flush()
+    return seq_num - 1, allocated
+
+SENDERS = {'copy': copy_sender, 'mmap': mmap_sender}
+#The batch sender is only different from the mmap sender where sendmmsg is available
+if batchio.available():
+    SENDERS['batch'] = batch_sender
+
+#Running one sender in the child process. The packets are sent to a socket
+#on loopback that nobody reads from, so we only measure the cost of sending.
+#It first measures the packets per second, then the bytes allocated per packet
+#with tracemalloc, and at last the peak RSS of the process
+def run_sender(name, file_name, window_size):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(receiver.getsockname())
+
+    start = time.perf_counter()
+    packets, _ = SENDERS[name](sock, file_name, window_size)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    samples, allocated = SENDERS[name](sock, file_name, window_size, trace=True)
+    tracemalloc.stop()
+
+    sock.close()
+    receiver.close()
+    #ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'packets': packets, 'packets_per_second': packets / elapsed,
+            'bytes_allocated_per_packet': allocated / min(samples, ALLOCATION_SAMPLES), 'peak_rss_mb': peak_rss}
+
+def bench_sender(file_name, window_size):
+    print("Sender path, {} byte file, window {}".format(os.path.getsize(file_name), window_size))
+    print("{:<6} {:>12} {:>22} {:>14}".format("path", "packets/s", "bytes alloc/packet", "peak RSS MB"))
+    for name in SENDERS:
+        #A new process for every sender, so the peak RSS is its own
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            result = pool.apply(run_sender, (name, file_name, window_size))
+        print("{:<6} {:>12.0f} {:>22.1f} {:>14.1f}".format(name, result['packets_per_second'],
+              result['bytes_allocated_per_packet'], result['peak_rss_mb']))
+
+#The way packets were packed and parsed before the codec: the format string is looked up
+#for every packet, the header and the data are put together in a new bytes object,
+#and slicing the data out of a received packet copies it
+OLD_FORMATS = {1: '!HHH', 2: '!HHHII', 3: '!HHHIII'}
+OLD_SIZES = {version: struct.calcsize(header_format) for version, header_format in OLD_FORMATS.items()}
+
+def format_string_encode(seq_num, ack_num, flags, data, version):
+    if version == 3:
+        header = struct.pack(OLD_FORMATS[2], 3, flags, len(data), seq_num, ack_num)
+        header += struct.pack('!I', zlib.crc32(data, zlib.crc32(header)))
+    elif version == 2:
+        header = struct.pack(OLD_FORMATS[2], 2, flags, len(data), seq_num, ack_num)
+    else:
+        header = struct.pack(OLD_FORMATS[1], seq_num, ack_num, flags)
+    return header + data
+
+def format_string_decode(packet, version):
+    size = OLD_SIZES[version]
+    if version == 1:
+        seq_num, ack_num, flags = struct.unpack(OLD_FORMATS[1], packet[:size])
+        return seq_num, ack_num, flags, packet[size:]
+    values = struct.unpack(OLD_FORMATS[version], packet[:size])
+    _, flags, length, seq_num, ack_num = values[:5]
+    data = packet[size:size + length]
+    if version == 3 and zlib.crc32(data, zlib.crc32(packet[:OLD_SIZES[2]])) != values[5]:
+        return None
+    return seq_num, ack_num, flags, data
+
+#Packets per second through function, which is called with count sequence numbers.
+#They are kept within 16 bits so they fit in the version 1 header
+def packets_per_second(function, count):
+    start = time.perf_counter()
+    for seq_num in range(1, count + 1):
+        function(seq_num & 0xFFFF)
+    return count / (time.perf_counter() - start)
+
+#The bytes allocated for each packet by function, measured with tracemalloc
+def bytes_per_packet(function):
+    allocated = 0
+    tracemalloc.start()
+    for seq_num in range(1, ALLOCATION_SAMPLES + 1):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(seq_num)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return allocated / ALLOCATION_SAMPLES
+
+#Packing and parsing full data packets of every header version, the old way with format
+#strings and the codec's way with precompiled structs. The codec packs into one buffer
+#that is used for every packet, and parses with memoryviews so the data isn't copied.
+#The packets that are parsed are memoryviews of a bytearray, like the ones the server
+#gets from its receive batch
+def bench_codec(count, payload_size):
+    data = os.urandom(payload_size)
+    buffer = memoryview(bytearray(HEADER_SIZES[3] + payload_size))
+    print("Packet codec, {} packets of {} bytes of data".format(count, payload_size))
+    print("{:<8} {:>16} {:>16} {:>16} {:>16} {:>14} {:>14}".format("header", "format encode/s", "codec encode/s", "format decode/s",
+          "codec decode/s", "format B/pkt", "codec B/pkt"))
+    for version in (1, 2, 3):
+        packet = memoryview(bytearray(create_packet(1, 0, 0, data, version)))
+        parse = parse_checked if version == 3 else lambda packet: parse_packet(packet, version)
+        assert format_string_decode(packet, version)[3] == parse(packet)[3]
+        encoders = [lambda seq_num: format_string_encode(seq_num, 0, 0, data, version),
+                    lambda seq_num: pack_packet_into(buffer, seq_num, 0, 0, data, version)]
+        results = [packets_per_second(encoders[0], count), packets_per_second(encoders[1], count),
+                   packets_per_second(lambda seq_num: format_string_decode(packet, version), count),
+                   packets_per_second(lambda seq_num: parse(packet), count),
+                   bytes_per_packet(encoders[0]), bytes_per_packet(encoders[1])]
+        print("{:<8} {:>16.0f} {:>16.0f} {:>16.0f} {:>16.0f} {:>14.1f} {:>14.1f}".format("v{}".format(version), *results))
+
+def main():
+    parser = argparse.ArgumentParser(description='DRTP benchmarks')
+    parser.add_argument('-f', '--file', help='File to send (a random file is made if not given)')
+    parser.add_argument('--size', type=int, default=64, help='Size in MB of the random file')
+    parser.add_argument('-w', '--window', type=int, default=64, help='Window size in packets')
+    parser.add_argument('--codec', action='store_true', help='Only measure how many packets are packed and parsed per second')
+    parser.add_argument('--packets', type=int, default=CODEC_PACKETS, help='How many packets the codec benchmark packs and parses')
+    parser.add_argument('--mss', type=int, default=PAYLOAD_SIZE, help='Bytes of data in each packet of the codec benchmark')
+    args = parser.parse_args()
+
+    if args.codec:
+        bench_codec(args.packets, min(args.mss, MAX_PAYLOAD))
+        return
+
+    if args.file:
+        bench_sender(args.file, args.window)
+        return
+    with tempfile.NamedTemporaryFile() as file:
+        #Writing it a megabyte at the time so this process stays small
+        for _ in range(args.size):
+            file.write(os.urandom(1024 * 1024))
+        file.flush()
+        bench_sender(file.name, args.window)
+
+if __name__ == '__main__':
+    main()
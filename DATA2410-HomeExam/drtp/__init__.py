@@ -0,0 +1,20 @@
+#DRTP, a reliable transport protocol on top of UDP, as a package other programs can use.
+#
+#    from drtp import Receiver, Sender
+#    with Receiver('127.0.0.1', 0, output='received') as receiver:
+#        Sender(receiver.address, window_size=64, arq='sr').send('photo.jpg')
+#
+#codec has the packets and is imported right away. The sender and the receiver
+#import a lot more (asyncio, ctypes for the batches), so they are only imported when
+#Sender or Receiver is used, and a program that only packs packets starts quickly
+from .codec import (ACK, FIN, HEADER_VERSION, MAX_PAYLOAD, PAYLOAD_SIZE, PROBE, RST, SR, SYN,
+                    create_packet, pack_packet_into, parse_checked, parse_packet)
+
+#Where the names that are imported when they are first used are found
+LAZY_NAMES = {'Sender': 'sender', 'Receiver': 'receiver'}
+
+def __getattr__(name):
+    if name not in LAZY_NAMES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    import importlib
+    return getattr(importlib.import_module('.' + LAZY_NAMES[name], __name__), name)
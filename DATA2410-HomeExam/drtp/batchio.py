@@ -0,0 +1,211 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import struct
+import sys
+
+#Sending and receiving many UDP packets with one system call.
+#Every sendto and recvfrom is a system call and a round in the Python loop,
+#and that is what limits how many packets per second we can send once the
+#window is large. On Linux sendmmsg and recvmmsg can send or receive a whole
+#batch of packets at once. Python doesn't have them, so we call them from the
+#C library with ctypes. On other systems the batches are sent one packet at the time.
+
+#How many packets there are room for in one batch
+BATCH_SIZE = 64
+
+#recvmmsg shouldn't wait when there are no more packets
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+
+#The C structures used by sendmmsg and recvmmsg (see man sendmmsg)
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(iovec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr), ('msg_len', ctypes.c_uint)]
+
+#The address of an IPv4 sender: family, port and IP address
+class sockaddr_in(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint8 * 4), ('sin_zero', ctypes.c_uint8 * 8)]
+
+#The start of the C structure Python uses to share the memory of an object.
+#We only need the address of the memory, which is the first field
+class Py_buffer(ctypes.Structure):
+    _fields_ = [('buf', ctypes.c_void_p), ('obj', ctypes.c_void_p), ('len', ctypes.c_ssize_t),
+                ('rest', ctypes.c_char * 128)]
+
+#Finding sendmmsg and recvmmsg in the C library. If we can't, the batches are sent one by one.
+#We only do this on 64-bit Linux, where the fields of an iovec are two 64-bit numbers
+libc = None
+if sys.platform.startswith('linux') and ctypes.sizeof(iovec) == 16:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    except (OSError, AttributeError):
+        libc = None
+
+#True if the packets really are sent and received in batches
+def available():
+    return libc is not None
+
+#Finding the address in memory of an object like a memoryview or a mmap, even
+#when it is read-only. The address is only valid as long as the object is alive
+def buffer_address(obj):
+    view = Py_buffer()
+    ctypes.pythonapi.PyObject_GetBuffer(ctypes.py_object(obj), ctypes.byref(view), 0)
+    address = view.buf
+    ctypes.pythonapi.PyBuffer_Release(ctypes.byref(view))
+    return address
+
+#Raising the error from the C library as a Python OSError
+def raise_errno():
+    error = ctypes.get_errno()
+    raise OSError(error, os.strerror(error))
+
+#A batch of packets that are all sent to the socket's connected address. Every
+#packet is a header and a slice of data from a memoryview, like a memory-mapped
+#file, so the data is never copied. The headers are packed straight into a buffer
+#that is made once, and the C structures pointing to the headers and the data
+#are also made once and only filled in for every packet
+class SendBatch:
+    def __init__(self, sock, view, header_format, size=BATCH_SIZE):
+        self.sock = sock
+        self.view = view
+        self.header = struct.Struct(header_format)
+        self.size = size
+        self.count = 0
+        self.headers = bytearray(self.header.size * size)
+        #Where the data of every packet in the batch starts, and how long it is
+        self.offsets = [0] * size
+        self.lengths = [0] * size
+        if libc is None:
+            return
+        self.view_address = buffer_address(view) if len(view) else 0
+        self.messages = (mmsghdr * size)()
+        self.iovecs = (iovec * (2 * size))()
+        headers_address = ctypes.addressof(ctypes.c_char.from_buffer(self.headers))
+        for i in range(size):
+            self.iovecs[2 * i].iov_base = headers_address + i * self.header.size
+            self.iovecs[2 * i].iov_len = self.header.size
+            self.messages[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[2 * i])
+            self.messages[i].msg_hdr.msg_iovlen = 2
+        #Setting fields through ctypes is slow, so the data's address and length are
+        #written straight into the iovecs as 64-bit numbers (two for every iovec)
+        self.slots = memoryview(self.iovecs).cast('B').cast('Q')
+
+    #Adding a packet with the given header values and the data from offset to
+    #offset + length. The batch is sent when it is full
+    def add(self, offset, length, *header_values):
+        i = self.count
+        self.header.pack_into(self.headers, i * self.header.size, *header_values)
+        if libc is not None:
+            self.slots[4 * i + 2] = self.view_address + offset
+            self.slots[4 * i + 3] = length
+        else:
+            self.offsets[i] = offset
+            self.lengths[i] = length
+        self.count += 1
+        if self.count == self.size:
+            self.flush()
+
+    #Sending all the packets in the batch
+    def flush(self):
+        if self.count == 0:
+            return
+        if libc is None:
+            header_size = self.header.size
+            for i in range(self.count):
+                header = self.headers[i * header_size:(i + 1) * header_size]
+                data = self.view[self.offsets[i]:self.offsets[i] + self.lengths[i]]
+                if hasattr(self.sock, 'sendmsg'):
+                    self.sock.sendmsg([header, data])
+                else:
+                    self.sock.send(header + data)
+            self.count = 0
+            return
+        sent = 0
+        fd = self.sock.fileno()
+        while sent < self.count:
+            #sendmmsg may send only some of the packets, and then we send the rest
+            result = libc.sendmmsg(fd, ctypes.byref(self.messages[sent]), self.count - sent, 0)
+            if result < 0:
+                if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    #The socket's send buffer is full, so we wait until there is room
+                    select.select([], [fd], [], 0.01)
+                    continue
+                raise_errno()
+            sent += result
+        self.count = 0
+
+#Receiving all the packets that are waiting at the socket. The packets are put in
+#one large buffer that is made once, and are given back as memoryviews of it, so they
+#are only valid until the next call to receive.
+class RecvBatch:
+    def __init__(self, sock, packet_size, size=BATCH_SIZE):
+        self.sock = sock
+        self.packet_size = packet_size
+        self.size = size
+        self.buffer = bytearray(packet_size * size)
+        self.view = memoryview(self.buffer)
+        #How much of each packet the C structures are set up to receive
+        self.receive_size = packet_size
+        #The senders' addresses as tuples, so they only have to be made once per sender
+        self.addresses = {}
+        if libc is None:
+            return
+        self.messages = (mmsghdr * size)()
+        self.iovecs = (iovec * size)()
+        self.names = (sockaddr_in * size)()
+        start = ctypes.addressof(ctypes.c_char.from_buffer(self.buffer))
+        for i in range(size):
+            self.iovecs[i].iov_base = start + i * packet_size
+            self.iovecs[i].iov_len = packet_size
+            self.messages[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            self.messages[i].msg_hdr.msg_iovlen = 1
+            self.messages[i].msg_hdr.msg_name = ctypes.addressof(self.names[i])
+
+    #Receiving at most size bytes of each packet. The first packet is waited for
+    #like a normal recvfrom, which also handles the socket's timeout and Ctrl+C.
+    #After that we take all the packets that are already waiting, without waiting.
+    #Returns a list of (packet, address)
+    def receive(self, size):
+        size = min(size, self.packet_size)
+        length, address = self.sock.recvfrom_into(self.view[:size], size)
+        packets = [(self.view[:length], address)]
+        if libc is None or self.size == 1:
+            return packets
+        if size != self.receive_size:
+            for i in range(self.size):
+                self.iovecs[i].iov_len = size
+            self.receive_size = size
+        for i in range(1, self.size):
+            self.messages[i].msg_hdr.msg_namelen = ctypes.sizeof(sockaddr_in)
+        count = libc.recvmmsg(self.sock.fileno(), ctypes.byref(self.messages[1]), self.size - 1, MSG_DONTWAIT, None)
+        if count < 0:
+            if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return packets
+            raise_errno()
+        for i in range(1, count + 1):
+            start = i * self.packet_size
+            packets.append((self.view[start:start + self.messages[i].msg_len], self.address(self.names[i])))
+        return packets
+
+    #Turning the C address into an (IP, port) tuple like recvfrom gives
+    def address(self, name):
+        key = (bytes(name.sin_addr), name.sin_port)
+        address = self.addresses.get(key)
+        if address is None:
+            address = (socket.inet_ntoa(key[0]), socket.ntohs(name.sin_port))
+            self.addresses[key] = address
+        return address
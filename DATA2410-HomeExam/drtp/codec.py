@@ -0,0 +1,159 @@
+import struct
+import zlib
+
+#The packets of DRTP, used by both the sender and the receiver.
+#Every header format is compiled once into a struct.Struct here, so packing and
+#unpacking a packet doesn't look up and parse a format string each time. Packets are
+#parsed through a memoryview, so the data that is given back is a view into the
+#packet and not a copy of it
+
+#Im using constants for the flags for the simplicity
+#when creating packets.
+#The binary representation of the flags
+#SYN=1000, ACK=0100, FIN=0010, SR=0001, PROBE=10000, RST=100000
+#SR is only used in the SYN and SYN-ACK to agree on Selective Repeat
+#PROBE is used for the packets that find the largest packet size before the SYN
+#RST is sent by the server when it has given up a connection, like when the disk is
+#full, so the client stops sending. Older clients don't look at it
+SYN = 0x8
+ACK = 0x4
+FIN = 0x2
+SR = 0x1
+PROBE = 0x10
+RST = 0x20
+
+#Checking the struct offical page I found out
+#that I will have to use HHH which is equal
+#to 6 bytes: 3 unsigned shorts (2 bytes each)
+#This is header version 1. Since the sequence numbers are only 16 bits,
+#it can't be used for files with more than 65535 packets (about 65 MB)
+header_format = '!HHH'
+header_v1 = struct.Struct(header_format)
+
+#Header version 2 is 14 bytes: version, flags and the length of the data
+#as unsigned shorts, and the sequence and acknowledgment numbers as
+#unsigned ints (4 bytes each). With 32 bit sequence numbers and 994 bytes
+#in each packet we can send files of about 4 TB, so they never wrap around.
+#The flags field has room for 16 flags
+header_format_v2 = '!HHHII'
+header_v2 = struct.Struct(header_format_v2)
+header_size_v2 = header_v2.size
+
+#Header version 3 is 18 bytes: the version 2 header with a CRC32 checksum at the end.
+#The checksum covers the rest of the header and the data, so a packet that was
+#damaged on the way, or cut off, is thrown away instead of written to the file
+header_format_v3 = '!HHHIII'
+header_v3 = struct.Struct(header_format_v3)
+header_size_v3 = header_v3.size
+#The part of the version 3 header in front of the checksum, and the checksum, packed once.
+#The version 2 header is the same as the start of the version 3 header
+checksum_header = header_v2
+checksum_field = struct.Struct('!I')
+
+#The header format, the compiled header and the header size of each version
+HEADER_FORMATS = {1: header_format, 2: header_format_v2, 3: header_format_v3}
+HEADERS = {1: header_v1, 2: header_v2, 3: header_v3}
+HEADER_SIZES = {version: header.size for version, header in HEADERS.items()}
+#The first two bytes of a packet with the version 2 and 3 headers
+VERSION_PREFIX = {2: b'\x00\x02', 3: b'\x00\x03'}
+
+#How much data we send in each packet, unless another size is agreed on in the SYN.
+#Every packet except the last one is full, so packet number seq starts at
+#byte (seq - 1) * payload size in the file
+PAYLOAD_SIZE = 994
+#A UDP packet can hold at most 65507 bytes, and the header takes some of them
+MAX_PAYLOAD = 65507 - header_size_v3
+
+#The newest header version we know. The version is agreed on in the SYN
+#and SYN-ACK, which are always sent with the version 1 header so older
+#programs can still understand them
+HEADER_VERSION = 3
+
+#Taking sequence number, acknowledgement number, flags
+#and data as parameters to create a new packet.
+#data is set to emty(0 bytes) as default for the
+#simplicity when establishing the 3 way handshake etc.
+#Returns a packet that is set together with the
+#header and data
+def create_packet(seq_num, ack_num, flags, data=b'', version=1):
+    checksum = packet_checksum(seq_num, ack_num, flags, data) if version == 3 else 0
+    #Once the header is created, we add the application data
+    return create_header(seq_num, ack_num, flags, len(data), version, checksum) + data
+
+#Packing the packet into a buffer we already have, like a bytearray that is used for
+#every packet, instead of making a new bytes object for the header and one for the
+#whole packet. The buffer has to have room for the header and the data, and copying
+#the data in is fastest when the buffer is a memoryview of the bytearray.
+#Returns how many bytes of the buffer the packet takes
+def pack_packet_into(buffer, seq_num, ack_num, flags, data=b'', version=1):
+    length = len(data)
+    if version == 3:
+        #The checksum is made first, so the whole header is packed into the buffer at once.
+        #Most of the time goes to the CRC32 of the data, and zlib reads it where it is
+        checksum = zlib.crc32(data, zlib.crc32(checksum_header.pack(3, flags, length, seq_num, ack_num)))
+        header_v3.pack_into(buffer, 0, 3, flags, length, seq_num, ack_num, checksum)
+        end = header_size_v3 + length
+        buffer[header_size_v3:end] = data
+        return end
+    if version == 2:
+        header_v2.pack_into(buffer, 0, 2, flags, length, seq_num, ack_num)
+        end = header_size_v2 + length
+        buffer[header_size_v2:end] = data
+        return end
+    header_v1.pack_into(buffer, 0, seq_num, ack_num, flags)
+    end = header_v1.size + length
+    buffer[header_v1.size:end] = data
+    return end
+
+#Creating only the header, for when the data is sent from where it already
+#is in memory instead of being copied into the packet.
+#The header values will be packed with the compiled header of the version
+def create_header(seq_num, ack_num, flags, length, version=1, checksum=0):
+    return HEADERS[version].pack(*header_values(seq_num, ack_num, flags, length, version, checksum))
+
+#The values of the header in the order of the header format of the version
+def header_values(seq_num, ack_num, flags, length, version=1, checksum=0):
+    if version == 3:
+        return 3, flags, length, seq_num, ack_num, checksum
+    if version == 2:
+        return 2, flags, length, seq_num, ack_num
+    return seq_num, ack_num, flags
+
+#The CRC32 checksum of a version 3 packet, over the header fields in front of the
+#checksum and the data. zlib computes it in C straight from the memoryview of the file
+def packet_checksum(seq_num, ack_num, flags, data):
+    return zlib.crc32(data, zlib.crc32(checksum_header.pack(3, flags, len(data), seq_num, ack_num)))
+
+#Function that parses the packet given in as parameter
+#so we can extract the header and data. In version 1 the header
+#is the first 6 bytes of the packet and the rest is data.
+#In version 2 and 3 the length field tells how much of the rest is data.
+#It will return the sequence number, acknowledgment number,
+#flags from the header and the data. The data is a memoryview of the
+#packet, so it has to be copied with bytes() if it is kept after the packet is reused.
+#The packets from a batch are memoryviews already, and only other packets get one
+def parse_packet(packet, version=1):
+    if type(packet) is not memoryview:
+        packet = memoryview(packet)
+    if version == 1:
+        seq_num, ack_num, flags = header_v1.unpack_from(packet)
+        return seq_num, ack_num, flags, packet[header_v1.size:]
+    #Version 2 and 3 start the same way, only the checksum is skipped in version 3
+    _, flags, length, seq_num, ack_num = header_v2.unpack_from(packet)
+    start = HEADER_SIZES[version]
+    return seq_num, ack_num, flags, packet[start:start + length]
+
+#Parsing a version 3 packet and checking its checksum with the same unpacking.
+#It covers the header in front of the checksum and the data, so a packet that is
+#damaged or cut off doesn't pass. Returns the same as parse_packet, or None for a damaged packet
+def parse_checked(packet):
+    if type(packet) is not memoryview:
+        packet = memoryview(packet)
+    try:
+        _, flags, length, seq_num, ack_num, checksum = header_v3.unpack_from(packet)
+    except struct.error:
+        return None
+    data = packet[header_size_v3:header_size_v3 + length]
+    if len(data) != length or zlib.crc32(data, zlib.crc32(packet[:header_size_v2])) != checksum:
+        return None
+    return seq_num, ack_num, flags, data
@@ -0,0 +1,178 @@
+import hashlib
+import lzma
+import mmap
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#Compressing the file while it is sent, and decompressing it on the server as it arrives.
+#Logs, CSV files and JSON often get several times smaller, and on a slow link that
+#makes the transfer just as many times faster. The client asks for a method in the SYN
+#and the server answers with it if it knows it. The compressed data is sent like a
+#file of its own, so the sequence numbers count the compressed bytes.
+#Files that don't get smaller, like photos, are sent as they are.
+
+#How much of the file is read and compressed at the time
+CHUNK_SIZE = 1024 * 1024
+#How much of the file is compressed to find out if it is worth it
+SAMPLE_SIZE = 256 * 1024
+#The compressed sample has to be at least this much smaller, else the file is sent as it is
+MIN_SAVING = 0.1
+
+#What the decompressors raise when the data isn't what the compressor made
+DECOMPRESSION_ERRORS = (zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+#The methods we know. zstd is only there if the zstandard package is installed
+def methods():
+    available = ['zlib', 'lzma']
+    if zstandard is not None:
+        available.append('zstd')
+    return available
+
+#A new compressor for the method. level is the compression level of the method,
+#and without it the method's own default is used
+def new_compressor(method, level=None):
+    if method == 'zlib':
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level)
+    if method == 'lzma':
+        return lzma.LZMACompressor(preset=level)
+    if method == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    raise ValueError("Unknown compression method {}".format(method))
+
+def new_decompressor(method):
+    if method == 'zlib':
+        return zlib.decompressobj()
+    if method == 'lzma':
+        return lzma.LZMADecompressor()
+    if method == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError("Unknown compression method {}".format(method))
+
+#Compressing a piece from the start and one from the middle of the part of the file we
+#send, to find out if it gets small enough to be worth it. Returns the size of the
+#compressed sample compared to the sample
+def sample_ratio(file_name, offset, length, method, level=None):
+    compressor = new_compressor(method, level)
+    size = 0
+    compressed = 0
+    with open(file_name, 'rb') as file:
+        for start in sorted({offset, offset + max(length // 2 - SAMPLE_SIZE // 2, 0)}):
+            file.seek(start)
+            sample = file.read(min(SAMPLE_SIZE, offset + length - start))
+            size += len(sample)
+            compressed += len(compressor.compress(sample))
+    compressed += len(compressor.flush())
+    return compressed / size if size else 1.0
+
+def worth_compressing(file_name, offset, length, method, level=None):
+    return sample_ratio(file_name, offset, length, method, level) <= 1 - MIN_SAVING
+
+#The compressed data of length bytes of the file from offset. It is made by a thread
+#a chunk at the time while the packets are sent, and put in an anonymous memory map, so
+#the packets are sent from it and found again in it just like from a memory-mapped file.
+#The map is as large as the data can get, but only the pages that are written take memory,
+#and the client gives the acknowledged ones back. produced is how much is compressed so
+#far, and the SHA-256 digest of the file data is made on the way for the FIN
+class CompressedStream:
+    def __init__(self, file_name, offset, length, method, level=None):
+        self.file_name = file_name
+        self.offset = offset
+        self.length = length
+        self.method = method
+        self.level = level
+        #No method makes data more than a little larger than it was
+        size = length + length // 8 + 65536
+        #The map has to be private. The pages of a shared anonymous map stay in memory
+        #when they are given back, and only a private map is freed by MADV_DONTNEED
+        if hasattr(mmap, 'MAP_PRIVATE'):
+            self.mm = mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE)
+        else:
+            self.mm = mmap.mmap(-1, size)
+        self.view = memoryview(self.mm)
+        self.produced = 0
+        self.raw_read = 0
+        self.done = False
+        self.error = None
+        self.stopped = False
+        self.digest = hashlib.sha256()
+        self.slices = []
+
+    #Starting the compression in a thread. The event is set every time there is more data.
+    #asyncio is only imported here, since only the sender needs it and it is slow to import
+    def start(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        self.more = asyncio.Event()
+        self.future = loop.run_in_executor(None, self.run, lambda: loop.call_soon_threadsafe(self.more.set))
+        return self
+
+    #The thread. zlib, lzma and zstd let go of the GIL while they work, so the
+    #compression can run at the same time as the sending on another core
+    def run(self, notify):
+        try:
+            compressor = new_compressor(self.method, self.level)
+            end = self.offset + self.length
+            with open(self.file_name, 'rb') as file:
+                file.seek(self.offset)
+                position = self.offset
+                while position < end and not self.stopped:
+                    raw = file.read(min(CHUNK_SIZE, end - position))
+                    if not raw:
+                        raise OSError("{} got shorter while it was sent".format(self.file_name))
+                    position += len(raw)
+                    self.digest.update(raw)
+                    self.append(compressor.compress(raw))
+                    self.raw_read += len(raw)
+                    notify()
+            self.append(compressor.flush())
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            notify()
+
+    def append(self, data):
+        if self.produced + len(data) > len(self.mm):
+            raise ValueError("The compressed data doesn't fit in the map")
+        self.mm[self.produced:self.produced + len(data)] = data
+        self.produced += len(data)
+
+    #How many packets can be sent: the full packets of the data compressed so far,
+    #and the last one as well when all of it is compressed. Also returns if all of it
+    #is compressed. done is looked at before produced, since the thread sets it last
+    def packets(self, payload_size):
+        if self.error is not None:
+            raise self.error
+        done = self.done
+        if done:
+            return (self.produced + payload_size - 1) // payload_size, done
+        return self.produced // payload_size, done
+
+    #Waiting until more of the file is compressed
+    async def wait(self):
+        self.more.clear()
+        if not self.done:
+            await self.more.wait()
+
+    #The compressed data when all of it is made, with the right length
+    def data(self):
+        view = self.view[:self.produced]
+        self.slices.append(view)
+        return view
+
+    #About how many bytes of the file the first compressed bytes came from
+    def raw_position(self, compressed):
+        return compressed * self.raw_read // self.produced if self.produced else 0
+
+    #Stopping the thread and giving back the map
+    async def close(self):
+        self.stopped = True
+        await self.future
+        for view in self.slices:
+            view.release()
+        self.view.release()
+        self.mm.close()
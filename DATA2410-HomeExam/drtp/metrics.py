@@ -0,0 +1,90 @@
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+#Logging and metrics for the client and the server.
+#Printing a line for every packet costs more than sending the packet, so that is
+#only done when it is asked for. What happens to a transfer is instead counted
+#in a metrics dictionary, which can be written as JSON when the transfer is done
+#and every few seconds while it is going on.
+
+#How much the client and server print. QUIET only prints errors and the results
+#of many transfers, INFO also prints what happens to every connection, and TRACE
+#prints a line for every packet, which slows down fast transfers a lot
+QUIET = 0
+INFO = 1
+TRACE = 2
+
+#The RTT histogram has buckets with upper limits doubling from 1/8 ms to 4 seconds.
+#The last bucket holds everything above that
+RTT_BUCKETS_MS = [2.0 ** i for i in range(-3, 13)]
+
+#Printing the message if the verbosity is at least the level of the message
+def log(verbosity, level, message):
+    if verbosity >= level:
+        print(message)
+
+#The time at the start of every packet trace line
+def timestamp():
+    return datetime.now().strftime("%H:%M:%S.%f")
+
+#The counters of one transfer. role is 'client' or 'server', and info tells which
+#transfer it is (the file, the address of the other side and so on)
+def new_metrics(role, **info):
+    metrics = {'role': role, 'start': time.time(), 'end': None, 'bytes': 0}
+    if role == 'client':
+        metrics.update(packets_sent=0, retransmissions=0, fast_retransmits=0, timeouts=0,
+                       acks_received=0, duplicate_acks=0, corrupt_packets=0, rtt_histogram=[0] * (len(RTT_BUCKETS_MS) + 1))
+    else:
+        metrics.update(packets_received=0, duplicate_packets=0, out_of_order_packets=0,
+                       dropped_packets=0, corrupt_packets=0, acks_sent=0)
+    metrics.update(info)
+    return metrics
+
+#Counting an RTT measurement (in seconds) in the histogram
+def record_rtt(metrics, sample):
+    ms = sample * 1000
+    if ms <= RTT_BUCKETS_MS[0]:
+        bucket = 0
+    else:
+        #The bucket is found from the power of two above the RTT
+        bucket = min(math.ceil(math.log2(ms)) + 3, len(RTT_BUCKETS_MS))
+    metrics['rtt_histogram'][bucket] += 1
+
+#A copy of the metrics that can be written as JSON, with the goodput (the file
+#data that got through per second) so far. state holds values that change all the
+#time and are only looked at when a snapshot is taken, like the cwnd and the RTT estimates
+def snapshot(metrics, final=False, **state):
+    record = {key: value for key, value in metrics.items() if key != 'rtt_histogram'}
+    end = metrics['end'] or time.time()
+    elapsed = end - metrics['start']
+    record['elapsed'] = round(elapsed, 6)
+    record['goodput_mbps'] = round(metrics['bytes'] * 8 / (elapsed * 1000000), 3) if elapsed > 0 else 0
+    #With compression bytes still counts the bytes of the file, so the goodput is how fast
+    #the file got through, and the ratio tells how much smaller it was on the way
+    if metrics.get('compressed_bytes'):
+        record['compression_ratio'] = round(metrics['bytes'] / metrics['compressed_bytes'], 3)
+    if 'rtt_histogram' in metrics:
+        labels = ["<={:g}ms".format(limit) for limit in RTT_BUCKETS_MS] + [">{:g}ms".format(RTT_BUCKETS_MS[-1])]
+        record['rtt_histogram'] = {label: count for label, count in zip(labels, metrics['rtt_histogram']) if count}
+    record['final'] = final
+    record.update(state)
+    return record
+
+#Writing a snapshot as one line of JSON. path '-' is the standard output, and
+#else the line is added to the end of the file. Many processes can write to the
+#same file, since every line is written with one system call to a file opened for appending
+def emit(path, record):
+    if path is None:
+        return
+    line = json.dumps(record) + "\n"
+    if path == '-':
+        print(line, end='')
+        return
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
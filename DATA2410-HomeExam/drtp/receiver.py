@@ -0,0 +1,945 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import random
+import signal
+import threading
+import time
+
+from . import batchio
+from .codec import (ACK, FIN, HEADER_VERSION, MAX_PAYLOAD, PAYLOAD_SIZE, PROBE, RST, SR, SYN, VERSION_PREFIX,
+                    create_packet, header_size_v3, pack_packet_into, parse_checked, parse_packet)
+from .compress import DECOMPRESSION_ERRORS, methods as compression_methods, new_decompressor
+from .metrics import INFO, QUIET, TRACE, emit, log, new_metrics, snapshot, timestamp
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#How many seconds a connection can be quiet before we give up on it. A closed
+#connection is also kept this long, so we can send the FIN-ACK again if it was lost
+IDLE_TIMEOUT = 60
+#How often we look for connections that have been quiet for too long
+SWEEP_INTERVAL = 1
+#How often the progress of the transfers is saved, so an interrupted transfer can
+#be resumed from where it was instead of from the start
+CHECKPOINT_INTERVAL = 1
+#The progress of a file is saved in a file with this after its name
+PROGRESS_SUFFIX = '.progress'
+#How much of the file is read back at the time for the digest
+DIGEST_CHUNK = 4 * 1024 * 1024
+#With delayed ACKs, how long an ACK for packets that arrived in order can wait for more
+#packets. It has to be well below the smallest RTO of the client (10 ms)
+ACK_DELAY = 0.002
+#The most packets in order a client can ask us to wait for before we send an ACK
+MAX_ACK_EVERY = 16
+#The SACK bitmap tells about at most this many packets after the missing one
+MAX_SACK_BITS = 1024
+SACK_MASK = (1 << MAX_SACK_BITS) - 1
+
+#Opening the file the received data is written to. If output is a directory the
+#file gets the name the client sent in the SYN. We only use the last part of the
+#name so the client can't write outside of the directory.
+#If the client told us the size of the file, we'll make room for all of it right
+#away, so the packets can be written straight to their place in the file even when
+#they arrive out of order. It returns the file descriptor and the path.
+#A file sent in stripes is opened by the first stripe like any other file, but the
+#lock is then made shared. The other stripes join the file the first stripe got,
+#with a shared lock as well, without emptying it
+def open_output_file(output, name, size, in_use=(), striped=False, join=False):
+    path = output_path(output, name)
+    if join:
+        #The first stripe may have got a number after the name, but the stripes
+        #can only join a file we could have given to the first stripe
+        joined = os.path.join(os.path.dirname(output), os.path.basename(name or ''))
+        if not os.path.isdir(output) and joined.startswith(output + '.'):
+            path = joined
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        lock_file(fd, shared=True)
+        return fd, path
+    #A file another connection is writing to, in this or in another worker process,
+    #gets a number after its name. The file is locked while we write to it, so
+    #the other workers can see that it is in use. It is only emptied once we have the lock
+    base = path
+    count = 1
+    while True:
+        if path not in in_use:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if lock_file(fd):
+                break
+            os.close(fd)
+        path = "{}.{}".format(base, count)
+        count += 1
+    try:
+        os.ftruncate(fd, 0)
+        if size:
+            try:
+                #posix_fallocate reserves the disk blocks, so the disk can't run full in the middle of the transfer
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError):
+                #Not every system or file system has it, and then we'll just set the size of the file
+                os.ftruncate(fd, size)
+    except OSError:
+        #The file can't be as large as the client says, so it is let go again
+        os.close(fd)
+        raise
+    if striped:
+        lock_file(fd, shared=True)
+    return fd, path
+
+#The path the file is saved to, before a number is put after it because it is in use
+def output_path(output, name):
+    if not os.path.isdir(output):
+        return output
+    name = os.path.basename(name or '')
+    if name in ('', '.', '..'):
+        name = 'received_file'
+    return os.path.join(output, name)
+
+#Opening the file of a transfer that was interrupted, so the client can go on from
+#where it was. The progress file next to it tells which file it was (file_id and
+#size) and how many bytes from the start of it are safely on the disk.
+#Returns the file descriptor, the path and the number of bytes we have, or None
+#if there is nothing to resume or somebody else is writing to the file
+def open_resumed_file(output, name, file_id, size, in_use=()):
+    path = output_path(output, name)
+    progress = read_progress(path)
+    if progress is None or progress.get('id') != file_id or progress.get('size') != size or path in in_use:
+        return None
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return None
+    if not lock_file(fd):
+        os.close(fd)
+        return None
+    return fd, path, min(max(int(progress.get('received', 0)), 0), size)
+
+#Reading the progress saved for the file at path. Returns None if there is none
+def read_progress(path):
+    try:
+        with open(path + PROGRESS_SUFFIX) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+#Saving how much of the file of the connection is received. The data has to be on
+#the disk before we say that it is, and the progress file is written next to it and
+#renamed in place, so a crash leaves either the old or the new progress, never half of it
+def save_progress(conn):
+    received = conn['offset'] + conn['total_data_received']
+    if received == conn['checkpoint']:
+        return
+    os.fsync(conn['output_fd'])
+    path = conn['output_path'] + PROGRESS_SUFFIX
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'id': conn['file_id'], 'size': conn['file_size'], 'received': received}, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+    conn['checkpoint'] = received
+
+#Removing the progress of a file, when all of it is received or a new file is written over it
+def remove_progress(path):
+    try:
+        os.remove(path + PROGRESS_SUFFIX)
+    except OSError:
+        pass
+
+#Taking a lock on the file that is let go when the file is closed. A shared lock
+#can be held by many at the same time, but not together with a lock that isn't shared.
+#Returns False if somebody else has the lock. Without fcntl we can't lock
+#files, and then only the connections in the same process know about each other
+def lock_file(fd, shared=False):
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+#Writing data at the given offset in the file without moving around in it
+def write_at(fd, data, offset):
+    if hasattr(os, 'pwrite'):
+        os.pwrite(fd, data, offset)
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+#Reading length bytes at the given offset in the file without moving around in it
+def read_at(fd, length, offset):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, length, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, length)
+
+#Adding the data of the connection that has arrived in order since last time to the
+#digest of the file. The data is read back from the file, so the digest checks what
+#really is on the disk, also for the packets that came out of order in Selective Repeat
+def update_digest(conn):
+    end = conn['offset'] + conn['total_data_received']
+    while conn['hashed'] < end:
+        data = read_at(conn['output_fd'], min(DIGEST_CHUNK, end - conn['hashed']), conn['hashed'])
+        if not data:
+            break
+        conn['digest'].update(data)
+        conn['hashed'] += len(data)
+
+#Writing compressed data that arrived in order. The data is decompressed and written after
+#the data we already have, so total_data_received counts the bytes of the file and not
+#the compressed bytes, and the progress and digest work just like without compression
+def write_decompressed(conn, data):
+    raw = conn['decompressor'].decompress(data)
+    if raw and conn['output_fd'] is not None:
+        write_at(conn['output_fd'], raw, conn['offset'] + conn['total_data_received'])
+    conn['total_data_received'] += len(raw)
+    conn['metrics']['compressed_bytes'] += len(data)
+
+#Sending an ACK for everything the connection has received in order. With SACK the
+#ACK also has a bitmap of the packets after the missing one that are buffered.
+#The ACK is packed into buffer, which is used for all the ACKs we send
+def send_ack(sock, conn, buffer):
+    data = b''
+    if conn['sack_bits']:
+        bits = conn['sack_bits'] & SACK_MASK
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    length = pack_packet_into(buffer, 0, conn['expected_seq_num'] - 1, ACK, data, conn['version'])
+    sock.sendto(buffer[:length], conn['address'])
+    conn['metrics']['acks_sent'] += 1
+    conn['unacked'] = 0
+    conn['ack_deadline'] = None
+
+#Acknowledging a packet on a connection with delayed ACKs. A packet that arrived in order
+#while nothing is missing only counts towards the next ACK, which is sent when ack_every
+#packets are waiting for it or after ACK_DELAY. Anything else is acknowledged right away,
+#so the client hears about lost packets as soon as possible
+def acknowledge(sock, conn, buffer, delay=False):
+    if delay:
+        conn['unacked'] += 1
+        if conn['unacked'] < conn['ack_every']:
+            if conn['ack_deadline'] is None:
+                conn['ack_deadline'] = time.time() + ACK_DELAY
+            return
+    send_ack(sock, conn, buffer)
+
+#Giving up on a connection whose file can't be written, because the disk is full or broken,
+#or whose compressed data can't be decompressed because it was damaged on the way. There is
+#no way to get the file right after that, so the connection is closed. The other
+#connections go on as before. The client is sent an RST so it stops sending, and it
+#gets the RST again for every packet it sends on the connection after that
+def give_up_connection(sock, conn, reason, verbosity=INFO, stats=None):
+    print("{}, closing the connection with {}:{}".format(reason, *conn['address']))
+    close_connection(conn, verbosity, stats)
+    conn['closed'] = True
+    conn['reset'] = create_packet(0, 0, RST, version=conn['version'])
+    sock.sendto(conn['reset'], conn['address'])
+
+#Reading the options the client sends as JSON in the data of the SYN, and checking
+#them once so the rest of the server can trust them. The numbers are made ints and the
+#header version is kept to the versions we know. Raises TypeError, ValueError or
+#AttributeError for options that are damaged or wrong, and then the SYN is ignored
+def read_syn_options(data):
+    options = json.loads(bytes(data)) if data else {}
+    if not isinstance(options, dict):
+        raise TypeError("the options are not a JSON object")
+    for key in ('version', 'mss', 'offset', 'ack_every'):
+        if key in options:
+            options[key] = int(options[key])
+    if 'version' in options:
+        options['version'] = max(1, min(options['version'], HEADER_VERSION))
+    for key in ('name', 'compression'):
+        if options.get(key) is not None and not isinstance(options[key], str):
+            raise TypeError("{} is not a string".format(key))
+    if options.get('size') is not None and (not isinstance(options['size'], int) or options['size'] < 0):
+        raise ValueError("size is not a size")
+    return options
+
+#Everything the server knows about one connection. Every client has its own,
+#found by the client's address, so many clients can send files at the same time
+def new_connection(address):
+    return {'address': address,
+            #The sequence number of the next packet we want, to hold track on if there is any packets out of order
+            'expected_seq_num': 1,
+            #When the first data in order arrived and how much data we got, for the throughput
+            'start_time': None,
+            'total_data_received': 0,
+            #Selective Repeat is turned on if the client asks for it in the SYN
+            'selective_repeat': False,
+            #The packets that are received out of order in Selective Repeat,
+            #holding the data length for each sequence number until the missing packets arrive.
+            #Compressed data can only be decompressed in order, so then the data itself is held
+            'out_of_order': {},
+            #With SACK the ACKs are cumulative and have a bitmap of the buffered packets, where bit i
+            #is packet expected_seq_num + 1 + i. The ACKs may be delayed until ack_every packets
+            #have arrived in order or until ack_deadline, and unacked is how many are waiting
+            'sack': False,
+            'sack_bits': 0,
+            'ack_every': 1,
+            'unacked': 0,
+            'ack_deadline': None,
+            #The header version and how much data there is in each packet, agreed on in the SYN
+            'version': 1,
+            'payload_size': PAYLOAD_SIZE,
+            #Where in the file the data of the connection starts, when the file is sent in stripes
+            'offset': 0,
+            #Decompresses the data when the client compresses it, with the method agreed on in the SYN
+            'decompressor': None,
+            #The file the received data is written to, if the server was given an output path
+            'output_fd': None,
+            'output_path': None,
+            #Which file the client sends and its size, so the transfer can be resumed if it is
+            #interrupted, and how far into the file the saved progress goes
+            'file_id': None,
+            'file_size': None,
+            'checkpoint': 0,
+            #The SHA-256 digest of the data written to the file so far, and how far into
+            #the file it goes. The client sends its digest in the FIN, and we check it
+            'digest': None,
+            'hashed': 0,
+            #When we last heard from the client, and if the client has closed the connection
+            'last_packet': time.time(),
+            'closed': False,
+            #The SYN-ACK and FIN-ACK we sent, so we can send them again if the client didn't get them,
+            #and the RST if we gave up the connection
+            'syn_ack': b'',
+            'fin_ack': b'',
+            'reset': None,
+            #Counting what happens to the connection
+            'metrics': new_metrics('server', client="{}:{}".format(*address))}
+
+#A snapshot of the metrics of a connection
+def connection_snapshot(conn, final=False, **state):
+    conn['metrics']['bytes'] = conn['total_data_received']
+    return snapshot(conn['metrics'], final, expected_seq_num=conn['expected_seq_num'],
+                    buffered_packets=len(conn['out_of_order']), **state)
+
+#Closing the output file of a connection and printing its throughput.
+#The time is counted until the last packet we got from the client.
+#The last snapshot of its metrics is written to the stats file, and completed
+#tells if the client closed the connection with a FIN
+#The progress of a file that didn't get through is saved so the client can resume it,
+#and the progress of a file that did is removed
+def close_connection(conn, verbosity=INFO, stats=None, completed=False):
+    if conn['output_fd'] is not None:
+        if conn['file_id'] is not None:
+            if completed:
+                remove_progress(conn['output_path'])
+            else:
+                try:
+                    save_progress(conn)
+                    log(verbosity, INFO, "{} of {} bytes of {} are saved and can be resumed".format(conn['checkpoint'], conn['file_size'], conn['output_path']))
+                except OSError as e:
+                    print("The progress of {} can't be saved ({})".format(conn['output_path'], e))
+        os.close(conn['output_fd'])
+        conn['output_fd'] = None
+    if conn['start_time']:
+        elapsed_time = conn['last_packet'] - conn['start_time']
+        if elapsed_time > 0:
+            #Calculate throughput in Mbps
+            throughput = (conn['total_data_received'] * 8) / (elapsed_time * 1000000)
+            log(verbosity, INFO, "\nThe throughput is {:.2f} Mbps ({}:{})".format(throughput, *conn['address']))
+        conn['start_time'] = None
+    conn['metrics']['end'] = conn['last_packet']
+    emit(stats, connection_snapshot(conn, True, completed=completed))
+
+#Creating the UDP socket and binding it to the address.
+#AF_INET indicates that the underlying network is using IPv4
+#SOCK_DGRAM indicates that it is a UDP socket
+#With reuse_port several processes can bind to the same port, and the
+#kernel shares the clients between them.
+#Raises OSError if the socket can't be bound
+def bind_socket(ip, port, reuse_port=False, rcvbuf=None, sndbuf=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    #A larger receive buffer holds more packets while we are busy writing to the disk,
+    #so a burst from the clients isn't dropped by the system before we get to it
+    if rcvbuf:
+        set_buffer_size(sock, socket.SO_RCVBUF, rcvbuf, 'receive')
+    if sndbuf:
+        set_buffer_size(sock, socket.SO_SNDBUF, sndbuf, 'send')
+    try:
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        #Bind the server socket
+        sock.bind((ip, port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+#The same for the command line, where the program stops if the binding fails
+def open_socket(ip, port, **options):
+    try:
+        return bind_socket(ip, port, **options)
+    except OSError:
+        #Throwing an exception if the binding fails
+        print("Bind failed. Error : ")
+        sys.exit()
+
+#Setting the size of the receive or send buffer of the socket. The system doesn't give us
+#more than its limit (net.core.rmem_max and wmem_max on Linux), so we tell if we got less.
+#Linux counts its own bookkeeping in the buffer and gives back twice the size we ask for
+def set_buffer_size(sock, option, size, name):
+    sock.setsockopt(socket.SOL_SOCKET, option, size)
+    actual = sock.getsockopt(socket.SOL_SOCKET, option)
+    if sys.platform.startswith('linux'):
+        actual //= 2
+    if actual < size:
+        print("Asked for a {} buffer of {} bytes, but the system only gives {}".format(name, size, actual))
+
+#Receiving files from any number of clients on the socket until we are stopped.
+#discard is the share of the data packets we drop on purpose to test the
+#retransmissions, and with a seed the same packets are dropped every time.
+#With a stop event the server also stops when it is set, at the latest
+#SWEEP_INTERVAL later. The socket is closed when the server stops
+def serve(sock, discard, output=None, max_payload=None, batching=True, verbosity=INFO, stats=None, stats_interval=0, seed=None, stop=None):
+    #Printing a line for every packet is slow, so it is only done when asked for
+    trace = verbosity >= TRACE
+    #The random numbers that decide which packets are dropped
+    drop_random = random.Random(seed)
+    #The connections we know about, found by the address of the client
+    connections = {}
+    #The connections with an ACK that is waiting for more packets
+    delayed_acks = {}
+    #Initicalize the server sequence number
+    server_seq_num = 0
+    #The receive buffer is as large as the largest packet we can get, since the
+    #clients may use different packet sizes and may probe with packets as large as we allow.
+    #Without a limit from the user we allow the largest packets UDP can carry
+    max_payload = min(max_payload or MAX_PAYLOAD, MAX_PAYLOAD)
+    recv_size = header_size_v3 + max_payload
+    #Receiving the packets in batches, with room for the largest packet we allow
+    receiver = batchio.RecvBatch(sock, recv_size, batchio.BATCH_SIZE if batching else 1)
+    #The ACKs are packed into this buffer instead of into new bytes for every ACK.
+    #It has room for the largest header and the largest SACK bitmap
+    ack_buffer = memoryview(bytearray(header_size_v3 + MAX_SACK_BITS // 8))
+    #We don't wait for packets longer than this, so we can look for connections that have gone quiet
+    sock.settimeout(SWEEP_INTERVAL)
+    last_sweep = time.time()
+    last_checkpoint = time.time()
+    #When the next snapshot of the metrics of the connections is written
+    next_sample = time.time() + stats_interval
+
+    try:
+        #A loop where the server continuously waits to receive packets from the clients until it is stopped
+        while stop is None or not stop.is_set():
+            #Receive the packets that are waiting and the clients' addresses. On Linux all the
+            #packets that are waiting are taken with one system call, and else one at the time
+            try:
+                packets = receiver.receive(recv_size)
+            except socket.timeout:
+                packets = []
+
+            #Giving up on the connections we haven't heard from in a while. The client has
+            #either stopped without closing the connection, or is done and got our FIN-ACK
+            now = time.time()
+            if now - last_sweep >= SWEEP_INTERVAL:
+                last_sweep = now
+                for address, conn in list(connections.items()):
+                    if now - conn['last_packet'] > IDLE_TIMEOUT:
+                        if not conn['closed']:
+                            log(verbosity, INFO, "\nNo packets from {}:{} in {} seconds, closing the connection".format(address[0], address[1], IDLE_TIMEOUT))
+                            close_connection(conn, verbosity, stats)
+                        del connections[address]
+            #Saving how far the transfers have come, so they can be resumed if the client or we stop
+            if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                last_checkpoint = now
+                for conn in connections.values():
+                    try:
+                        if not conn['closed'] and conn['file_id'] is not None and conn['output_fd'] is not None:
+                            save_progress(conn)
+                        #The digest is also brought up to date, so there is little left to hash at the FIN
+                        if not conn['closed'] and conn['digest'] is not None:
+                            update_digest(conn)
+                    except OSError as e:
+                        give_up_connection(sock, conn, "The file {} can't be written ({})".format(conn['output_path'], e), verbosity, stats)
+            #Writing how the open connections are going every stats_interval seconds
+            if stats_interval and now >= next_sample:
+                next_sample = now + stats_interval
+                for conn in connections.values():
+                    if not conn['closed']:
+                        emit(stats, connection_snapshot(conn))
+
+            for packet, client_address in packets:
+                #Get the current time for the packet trace
+                if trace:
+                    current_time = timestamp()
+                conn = connections.get(client_address)
+                #Parsing the received packet and extract client sequence number, flags and data
+                #The SYN always comes with the version 1 header, so a packet that doesn't
+                #start with the version number of a version 2 header must be version 1
+                if conn is not None and conn['version'] == 3 and packet[:2] == VERSION_PREFIX[3]:
+                    parsed = parse_checked(packet)
+                    #A version 3 packet that doesn't match its checksum was damaged on the way
+                    if parsed is None:
+                        conn['metrics']['corrupt_packets'] += 1
+                        if trace:
+                            print("{} -- damaged packet thrown away".format(current_time))
+                        continue
+                    client_seq_num, _, flags, data = parsed
+                elif conn is not None and conn['version'] == 2 and packet[:2] == VERSION_PREFIX[2]:
+                    client_seq_num, _, flags, data = parse_packet(packet, 2)
+                else:
+                    client_seq_num, _, flags, data = parse_packet(packet)
+                    #Without a connection only a SYN or a probe makes sense, and they always have
+                    #sequence number 0. A data packet with a version 2 or 3 header from a connection
+                    #we have forgotten starts with 2 or 3 there, and its length would be read as
+                    #the flags, so it could look like a SYN or a FIN
+                    if conn is None and client_seq_num != 0:
+                        continue
+                    #With version 3 only the SYN comes with the version 1 header. Anything else
+                    #is a packet that is so damaged that even its version number is wrong
+                    if conn is not None and conn['version'] == 3 and not flags & SYN:
+                        conn['metrics']['corrupt_packets'] += 1
+                        continue
+
+                #Since the clients will be sending many packets to the server, we'll have to
+                #handle different types of packets based on their flags
+
+                #If flags equals a SYN flag
+                if flags & SYN:
+                    #This is the first step in the 3 way handshake on server side 
+                    #The client has sent a SYN packet to initiate connection
+                    #which we have to handle now
+                    log(verbosity, INFO, "SYN packet is received from {}:{}".format(*client_address))
+                    #If the client sends the SYN again because our SYN-ACK was lost or late,
+                    #it gets the same SYN-ACK again. The connection may already have started,
+                    #so we can't start it over
+                    if conn is not None and not conn['closed']:
+                        conn['last_packet'] = time.time()
+                        sock.sendto(conn['syn_ack'], client_address)
+                        log(verbosity, INFO, "SYN-ACK packet is sent again")
+                        continue
+                    #The client sends its options as JSON in the data of the SYN.
+                    #An older client doesn't send any options and only knows version 1,
+                    #so it gets a SYN-ACK without data just like before
+                    try:
+                        options = read_syn_options(data)
+                    except (TypeError, ValueError, AttributeError) as e:
+                        log(verbosity, INFO, "The SYN from {}:{} has options we can't use ({}), ignoring it".format(*client_address, e))
+                        continue
+                    #A new connection starts from the first sequence number again
+                    conn = connections[client_address] = new_connection(client_address)
+                    #If the client has set the SR flag we'll use Selective Repeat and
+                    #echo the flag back in the SYN-ACK so the client knows that we agree
+                    conn['selective_repeat'] = bool(flags & SR)
+                    syn_ack_flags = SYN | ACK | SR if conn['selective_repeat'] else SYN | ACK
+                    if conn['selective_repeat']:
+                        log(verbosity, INFO, "Using Selective Repeat")
+                    #We'll use the newest header version that both of us know
+                    conn['version'] = options.get('version', 1)
+                    #The client asks for how much data it wants in each packet, and
+                    #gets that or the largest we allow
+                    if conn['version'] >= 2:
+                        conn['payload_size'] = max(1, min(options.get('mss', PAYLOAD_SIZE), max_payload))
+                    log(verbosity, INFO, "Using header version {} and {} bytes of data per packet".format(conn['version'], conn['payload_size']))
+                    #Opening the file the data will be written to. Two clients that send
+                    #files with the same name at the same time don't get the same file,
+                    #except for the stripes of one file
+                    #A client that sends the id of its file can resume the transfer if it
+                    #is interrupted. If we have a part of the same file from before, the client
+                    #is told how much we have and only sends the rest
+                    resumed = None
+                    if output and options.get('id') and isinstance(options.get('size'), int) and 'stripes' not in options and not options.get('join'):
+                        conn['file_id'], conn['file_size'] = str(options['id']), options['size']
+                        #A client that stopped and started again comes from a new port, while
+                        #its old connection still has the file. The old connection is given up
+                        for other in connections.values():
+                            if other is not conn and not other['closed'] and other['file_id'] == conn['file_id'] and other['output_fd'] is not None \
+                                    and other['output_path'] == output_path(output, options.get('name')):
+                                log(verbosity, INFO, "{}:{} is sending the same file again, closing its old connection".format(*client_address))
+                                close_connection(other, verbosity, stats)
+                                other['closed'] = True
+                        in_use = {other['output_path'] for other in connections.values() if other['output_fd'] is not None}
+                        resumed = open_resumed_file(output, options.get('name'), conn['file_id'], conn['file_size'], in_use)
+                    if resumed is not None:
+                        conn['output_fd'], conn['output_path'], conn['offset'] = resumed
+                        conn['checkpoint'] = conn['offset']
+                        conn['metrics']['resumed_from'] = conn['offset']
+                        log(verbosity, INFO, "Resuming {} from byte {} of {}".format(conn['output_path'], conn['offset'], conn['file_size']))
+                    elif output:
+                        in_use = {other['output_path'] for other in connections.values() if other['output_fd'] is not None}
+                        #The file may not be possible to make, like when the name is taken by a directory
+                        #or the size is larger than the file system allows. Then only this SYN is dropped
+                        try:
+                            conn['output_fd'], conn['output_path'] = open_output_file(output, options.get('name'), options.get('size'), in_use,
+                                                                                      'stripes' in options, bool(options.get('join')))
+                        except OSError as e:
+                            print("The file from {}:{} can't be saved ({}), ignoring its SYN".format(*client_address, e))
+                            del connections[client_address]
+                            continue
+                        #The progress of an older file with this name is not true any more
+                        if not options.get('join'):
+                            remove_progress(conn['output_path'])
+                        log(verbosity, INFO, "Writing the received file to {}".format(conn['output_path']))
+                    #We tell the client the options we agree on. A stripe of a file also gets
+                    #where its data goes, and the name of the file so the other stripes can join it
+                    syn_ack_options = {'version': conn['version'], 'mss': conn['payload_size']}
+                    if resumed is not None:
+                        syn_ack_options['resume'] = conn['offset']
+                    elif 'offset' in options:
+                        conn['offset'] = max(options['offset'], 0)
+                        syn_ack_options['offset'] = conn['offset']
+                        log(verbosity, INFO, "The data starts at byte {} of the file".format(conn['offset']))
+                    if conn['output_path']:
+                        syn_ack_options['name'] = os.path.basename(conn['output_path'])
+                        conn['metrics']['file'] = conn['output_path']
+                    elif options.get('name'):
+                        conn['metrics']['file'] = options['name']
+                    #A client that understands SACK gets cumulative ACKs with a bitmap, and can
+                    #ask us to wait for a few packets before we acknowledge them
+                    if conn['version'] >= 2 and options.get('sack'):
+                        conn['sack'] = True
+                        conn['ack_every'] = max(1, min(options.get('ack_every', 1), MAX_ACK_EVERY))
+                        syn_ack_options.update(sack=True, ack_every=conn['ack_every'])
+                    #The client can ask for its data to be compressed, and we answer with the method
+                    #if we know it. The data is then decompressed as it arrives in order
+                    if options.get('compression') in compression_methods():
+                        conn['decompressor'] = new_decompressor(options['compression'])
+                        syn_ack_options['compression'] = options['compression']
+                        conn['metrics'].update(compression=options['compression'], compressed_bytes=0)
+                        log(verbosity, INFO, "The data is compressed with {}".format(options['compression']))
+                    #With version 3 we hash the data as it is written, to check it against the digest in the FIN
+                    if conn['version'] == 3 and conn['output_fd'] is not None:
+                        conn['digest'] = hashlib.sha256()
+                        conn['hashed'] = conn['offset']
+                    syn_ack_data = json.dumps(syn_ack_options).encode() if options else b''
+                    #The second step in the 3 way handshake is to send a SYN-ACK packet to the
+                    #client to acknowledge and establish a connection 
+                    conn['syn_ack'] = create_packet(server_seq_num, client_seq_num + 1, syn_ack_flags, syn_ack_data)
+                    sock.sendto(conn['syn_ack'], client_address)
+                    log(verbosity, INFO, "SYN-ACK packet is sent")
+                    #We'll continue again from where we left
+                    continue
+
+                #The client is finding out how large packets can get through to us,
+                #so we'll tell it how many bytes of the probe we got
+                if flags & PROBE:
+                    sock.sendto(create_packet(0, len(packet), ACK | PROBE), client_address)
+                    continue
+
+                #Packets from a client that hasn't sent a SYN, or whose connection
+                #we have given up on, don't belong to any file
+                if conn is None:
+                    continue
+                conn['last_packet'] = time.time()
+
+                #The connection is closed, so the only thing the client can want is
+                #a new FIN-ACK because the one we sent was lost. If we gave up the
+                #connection, the client hasn't heard the RST yet
+                if conn['closed']:
+                    if conn['reset'] is not None:
+                        sock.sendto(conn['reset'], client_address)
+                    elif flags & FIN and conn['fin_ack']:
+                        sock.sendto(conn['fin_ack'], client_address)
+                    continue
+
+                if discard and drop_random.random() < discard:
+                    conn['metrics']['dropped_packets'] += 1
+                    if trace:
+                        print("Packet dropped")
+                    continue
+
+                version = conn['version']
+
+                #If flags equals a ACK flag and data is emty
+                if flags & ACK and not data:
+                    #Handle ACK packet for connection establishment
+                    log(verbosity, INFO, "ACK packet is received")
+                    log(verbosity, INFO, "Connection established with {}:{}\n".format(*client_address))
+                    #We'll continue again from where we left
+                    continue
+
+                #If flags equals a FIN flag 
+                if flags & FIN:
+                    #When we receive a FIN flag, it means that the client wants to terminate the connection
+                    #and want to make it on a reliable way where the client gives the server message about
+                    log(verbosity, INFO, "\nFIN packet is received from {}:{}".format(*client_address))
+                    #Making sure that all of the file is on the disk before we acknowledge the FIN.
+                    #A full disk often only shows up here, when the data is written out
+                    if conn['output_fd'] is not None:
+                        try:
+                            os.fsync(conn['output_fd'])
+                        except OSError as e:
+                            give_up_connection(sock, conn, "The file {} can't be written ({})".format(conn['output_path'], e), verbosity, stats)
+                            continue
+                        log(verbosity, INFO, "The file is saved as {}".format(conn['output_path']))
+                    #All the compressed data has arrived, so the decompressor should be at its end
+                    if conn['decompressor'] is not None and not getattr(conn['decompressor'], 'eof', True):
+                        print("The compressed data from {}:{} ended too early".format(*client_address))
+                    #With version 3 the client sends the digest of the data it sent, and we tell it
+                    #in the FIN-ACK if the data in our file has the same digest
+                    fin_ack_data = b''
+                    try:
+                        client_digest = json.loads(bytes(data)).get('digest') if data else None
+                    except ValueError:
+                        client_digest = None
+                    if client_digest and conn['digest'] is not None:
+                        try:
+                            update_digest(conn)
+                        except OSError as e:
+                            give_up_connection(sock, conn, "The file {} can't be read back ({})".format(conn['output_path'], e), verbosity, stats)
+                            continue
+                        verified = conn['digest'].hexdigest() == client_digest
+                        conn['metrics']['verified'] = verified
+                        fin_ack_data = json.dumps({'verified': verified}).encode()
+                        if verified:
+                            log(verbosity, INFO, "The digest of the file is the same as the client's")
+                        else:
+                            print("The file {} from {}:{} doesn't have the digest the client sent, it was damaged".format(conn['output_path'], *client_address))
+                    close_connection(conn, verbosity, stats, completed=True)
+                    #Send FIN-ACK packet to acknowledge termination to the client
+                    conn['fin_ack'] = create_packet(server_seq_num, client_seq_num + 1, ACK | FIN, fin_ack_data, version)
+                    sock.sendto(conn['fin_ack'], client_address)
+                    log(verbosity, INFO, "FIN ACK packet is sent")
+                    #The connection is kept a little while as closed, in case the FIN-ACK is lost
+                    conn['closed'] = True
+                    log(verbosity, INFO, "\nConnection with {}:{} closes".format(*client_address))
+                    continue
+            
+                #In Selective Repeat every packet is acknowledged on its own, and the
+                #packets that arrive out of order are kept until the missing ones arrive.
+                #Since every packet has its own place in the output file, the packets are
+                #written there right away, and we only have to remember their length
+                conn['metrics']['packets_received'] += 1
+                if conn['selective_repeat']:
+                    expected_seq_num = first_expected = conn['expected_seq_num']
+                    out_of_order = conn['out_of_order']
+                    #An ACK can only wait while the packets arrive in order and nothing is missing
+                    in_order = client_seq_num == expected_seq_num and not out_of_order
+                    if client_seq_num < expected_seq_num:
+                        #We already have this packet, so the ACK must have been lost.
+                        #We'll send the ACK again so the client stops resending it
+                        conn['metrics']['duplicate_packets'] += 1
+                        if trace:
+                            print("{} -- duplicate packet {} is received".format(current_time, client_seq_num))
+                    elif conn['decompressor'] is not None:
+                        #Compressed data is kept until it can be decompressed in order
+                        if client_seq_num == expected_seq_num:
+                            try:
+                                write_decompressed(conn, data)
+                                expected_seq_num += 1
+                                while expected_seq_num in out_of_order:
+                                    write_decompressed(conn, out_of_order.pop(expected_seq_num))
+                                    expected_seq_num += 1
+                            except DECOMPRESSION_ERRORS as e:
+                                give_up_connection(sock, conn, "The compressed data can't be decompressed ({})".format(e), verbosity, stats)
+                                continue
+                            except OSError as e:
+                                give_up_connection(sock, conn, "The file {} can't be written ({})".format(conn['output_path'], e), verbosity, stats)
+                                continue
+                            conn['expected_seq_num'] = expected_seq_num
+                            if not conn['start_time']:
+                                conn['start_time'] = time.time()
+                        elif client_seq_num not in out_of_order:
+                            conn['metrics']['out_of_order_packets'] += 1
+                            out_of_order[client_seq_num] = bytes(data)
+                    else:
+                        if conn['output_fd'] is not None and client_seq_num not in out_of_order:
+                            try:
+                                write_at(conn['output_fd'], data, conn['offset'] + (client_seq_num - 1) * conn['payload_size'])
+                            except OSError as e:
+                                give_up_connection(sock, conn, "The file {} can't be written ({})".format(conn['output_path'], e), verbosity, stats)
+                                continue
+                        if client_seq_num == expected_seq_num:
+                            if trace:
+                                print("{} -- packet {} is received".format(current_time, client_seq_num))
+                            conn['total_data_received'] += len(data)
+                            expected_seq_num += 1
+                            #The packet may have filled a gap, so the buffered packets
+                            #that now are in order can be delivered as well
+                            while expected_seq_num in out_of_order:
+                                conn['total_data_received'] += out_of_order.pop(expected_seq_num)
+                                expected_seq_num += 1
+                            conn['expected_seq_num'] = expected_seq_num
+                            if not conn['start_time']:
+                                conn['start_time'] = time.time()
+                        else:
+                            conn['metrics']['out_of_order_packets'] += 1
+                            if trace:
+                                print("{} -- packet {} received out of order, expected {}, buffering it".format(current_time, client_seq_num, expected_seq_num))
+                            out_of_order[client_seq_num] = len(data)
+                    if conn['sack']:
+                        #The bitmap starts after the missing packet, so it moves along when the gap is filled
+                        conn['sack_bits'] >>= conn['expected_seq_num'] - first_expected
+                        if client_seq_num > conn['expected_seq_num']:
+                            conn['sack_bits'] |= 1 << (client_seq_num - conn['expected_seq_num'] - 1)
+                        acknowledge(sock, conn, ack_buffer, in_order)
+                        if conn['ack_deadline'] is not None:
+                            delayed_acks[client_address] = conn
+                        continue
+                    length = pack_packet_into(ack_buffer, 0, client_seq_num, ACK, version=version)
+                    sock.sendto(ack_buffer[:length], client_address)
+                    conn['metrics']['acks_sent'] += 1
+                    if trace:
+                        print("{} -- sending ack for the received {}".format(current_time, client_seq_num))
+                    continue
+
+                #Checking if the received client sequence number is the same as the expected sequence number
+                #This is important to make sure that we don't send ack packets to wrong received packets
+                if client_seq_num == conn['expected_seq_num']:
+                    #Handle in-order data packet
+                    if trace:
+                        print("{} -- packet {} is received".format(current_time, client_seq_num))
+                    #Compressed data is decompressed and written after the data we have
+                    if conn['decompressor'] is not None:
+                        try:
+                            write_decompressed(conn, data)
+                        except DECOMPRESSION_ERRORS as e:
+                            give_up_connection(sock, conn, "The compressed data can't be decompressed ({})".format(e), verbosity, stats)
+                            continue
+                        except OSError as e:
+                            give_up_connection(sock, conn, "The file {} can't be written ({})".format(conn['output_path'], e), verbosity, stats)
+                            continue
+                    #Sending ACK for the received packet back to the client. With delayed
+                    #ACKs it is sent below, when we know if it has to wait for more packets
+                    if not conn['sack']:
+                        length = pack_packet_into(ack_buffer, 0, client_seq_num, ACK, version=version)
+                        sock.sendto(ack_buffer[:length], client_address)
+                        conn['metrics']['acks_sent'] += 1
+                        if trace:
+                            print("{} -- sending ack for the received {}".format(current_time, client_seq_num))
+                    #Writing the data to its place in the output file, and tracking the total data
+                    #received so we can calculate the throughput later
+                    if conn['decompressor'] is None:
+                        if conn['output_fd'] is not None:
+                            try:
+                                write_at(conn['output_fd'], data, conn['offset'] + (client_seq_num - 1) * conn['payload_size'])
+                            except OSError as e:
+                                give_up_connection(sock, conn, "The file {} can't be written ({})".format(conn['output_path'], e), verbosity, stats)
+                                continue
+                        conn['total_data_received'] += len(data)
+                    #Update expected sequence number for the next packet
+                    conn['expected_seq_num'] += 1
+                    if conn['sack']:
+                        acknowledge(sock, conn, ack_buffer, True)
+                        if conn['ack_deadline'] is not None:
+                            delayed_acks[client_address] = conn
+                    #This ensures that the start time of the data transfer is recorded 
+                    #only once when the first data is received in the correct order. 
+                    #This is crucial for accurately calculating the throughput 
+                    #based on the time taken to receive the data.
+                    if not conn['start_time']:
+                        conn['start_time'] = time.time()
+                else:
+                    #Handling the out-of-order data packet. A packet we already have was resent
+                    #because our ACK was lost or late
+                    if client_seq_num < conn['expected_seq_num']:
+                        conn['metrics']['duplicate_packets'] += 1
+                    else:
+                        conn['metrics']['out_of_order_packets'] += 1
+                    if trace:
+                        print("{} -- packet {} received out of order, expected {}".format(current_time, client_seq_num, conn['expected_seq_num']))
+                    #Acknowledging the last packet we got in order again. When the client
+                    #gets enough of these duplicate ACKs it knows that a packet is lost
+                    #and can resend it right away instead of waiting for the timeout
+                    send_ack(sock, conn, ack_buffer)
+                    if trace:
+                        print("{} -- sending duplicate ack for {}".format(current_time, conn['expected_seq_num'] - 1))
+
+            #Sending the delayed ACKs whose time has come, and waiting for packets
+            #no longer than until the next one is due
+            timeout = SWEEP_INTERVAL
+            if delayed_acks:
+                now = time.time()
+                for address, conn in list(delayed_acks.items()):
+                    if conn['closed'] or conn['ack_deadline'] is None:
+                        del delayed_acks[address]
+                    elif conn['ack_deadline'] <= now:
+                        send_ack(sock, conn, ack_buffer)
+                        del delayed_acks[address]
+                    else:
+                        timeout = min(timeout, conn['ack_deadline'] - now)
+            sock.settimeout(max(timeout, 0.0001))
+
+    finally:
+        #Closing the files of the connections that didn't finish and display their throughput,
+        #then the socket and print connection closure message
+        for conn in connections.values():
+            if not conn['closed']:
+                close_connection(conn, verbosity, stats)
+        sock.close()
+        log(verbosity, INFO, "\nConnection Closes")
+
+#Running the server on the address. With more than one worker, every worker is
+#its own process with its own socket bound to the same port (SO_REUSEPORT). The
+#kernel picks the worker from the client's address and port, so all the packets
+#of a connection go to the same worker
+def main(ip, port, discard=0, output=None, max_payload=None, batching=True, workers=1, verbosity=INFO, stats=None, stats_interval=0, seed=None,
+         rcvbuf=None, sndbuf=None):
+    options = {'verbosity': verbosity, 'stats': stats, 'stats_interval': stats_interval}
+    buffers = {'rcvbuf': rcvbuf, 'sndbuf': sndbuf}
+    if workers <= 1:
+        serve(open_socket(ip, port, **buffers), discard, output, max_payload, batching, seed=seed, **options)
+        return
+
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        print("More than one worker needs SO_REUSEPORT, which this system doesn't have")
+        sys.exit()
+    #Stopping the server with kill should stop the workers as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    processes = []
+    for worker in range(workers):
+        #Every worker drops different packets, but the same ones every time with the same seed
+        options['seed'] = None if seed is None else seed + worker
+        process = multiprocessing.Process(target=serve_worker, args=(ip, port, discard, output, max_payload, batching, buffers), kwargs=options)
+        process.start()
+        processes.append(process)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        #Ctrl+C goes to the workers as well, so we only have to wait for them
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+#One worker process, which has its own socket and connections
+def serve_worker(ip, port, discard, output, max_payload, batching, buffers, **options):
+    try:
+        serve(open_socket(ip, port, reuse_port=True, **buffers), discard, output, max_payload, batching, **options)
+    except KeyboardInterrupt:
+        pass
+
+#A server that other programs can run without going through application.py. The socket is
+#bound when the Receiver is made, so with port 0 the system picks a free port, which can
+#be read from address. serve() receives files until stop() is called from another thread,
+#and start() runs it in a thread of its own. The options are the same as for serve()
+class Receiver:
+    def __init__(self, ip='127.0.0.1', port=0, output=None, rcvbuf=None, sndbuf=None, discard=0, verbosity=QUIET, **options):
+        self.sock = bind_socket(ip, port, rcvbuf=rcvbuf, sndbuf=sndbuf)
+        self.address = self.sock.getsockname()
+        self.output = output
+        self.discard = discard
+        self.options = dict(options, verbosity=verbosity)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def serve(self):
+        serve(self.sock, self.discard, self.output, stop=self.stopped, **self.options)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+
+    #Stopping the server and waiting for it, if it runs in its own thread.
+    #The files that are still being received are closed like when the server is stopped with Ctrl+C
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,1190 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from . import batchio
+from .codec import (ACK, FIN, HEADER_FORMATS, HEADER_SIZES, HEADER_VERSION, MAX_PAYLOAD, PAYLOAD_SIZE, PROBE, RST, SR, SYN,
+                    create_packet, header_size_v3, header_v1, header_v2, header_v3, header_values, packet_checksum, parse_checked, parse_packet)
+from .compress import CompressedStream, methods as compression_methods, worth_compressing
+from .metrics import INFO, QUIET, TRACE, emit, log, new_metrics, record_rtt, snapshot, timestamp
+
+#The retransmission timeout (RTO) in seconds that is used until
+#we have measured the round trip time (RTT) of the connection
+TIMEOUT = 0.5
+#The RTO is kept within these limits, so a very short RTT on loopback
+#doesn't make us resend too early and the backoff doesn't grow forever.
+#The largest RTO is well below the time the server waits before it gives up a quiet
+#connection (IDLE_TIMEOUT), so it doesn't give up a client that is only backing off
+MIN_RTO = 0.01
+MAX_RTO = 30.0
+#How many timeouts in a row we'll take without hearing from the server before we give up
+#the transfer. On loopback that is about a minute, and longer on slower networks
+MAX_TIMEOUTS = 12
+#How many times we'll send the FIN before giving up
+FIN_RETRIES = 5
+#How many times we'll send the SYN before we decide that the server doesn't answer
+SYN_RETRIES = 5
+#How many files are sent at the same time when we are given more than one
+PARALLEL_TRANSFERS = 32
+#Receiving from the socket without waiting if there is nothing to receive
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+#How many duplicate ACKs we'll wait for before resending without waiting for the timer
+DUP_ACK_THRESHOLD = 3
+#How many packets in order the server may get before it has to send an ACK for them.
+#Fewer ACKs means fewer packets back to us and fewer receive calls. We ask for less
+#with a small window, so the server doesn't hold back the ACK for a whole window
+ACK_EVERY = 4
+#With pacing the window is let out over the RTT instead of all at once. The pacing rate
+#is the window per RTT times a gain, which is higher in slow start so the window can grow
+PACING_GAIN_SLOW_START = 2.0
+PACING_GAIN = 1.25
+#How much the pacer and the rate limit let out at once, in seconds of their rate.
+#The event loop can't wake us up much more often than every millisecond
+BURST_TIME = 0.001
+#The congestion window we start with, in packets. For packets of 994 bytes
+#this is the same as the initial window TCP uses (RFC 3390)
+INITIAL_CWND = 4
+
+#The smallest packet size we'll try when probing. Every IPv4 network has to
+#take packets of 576 bytes, which leaves 548 bytes when the IP and UDP headers are taken out
+MIN_PROBE_SIZE = 548
+#The IP and UDP headers in front of our packet
+IP_UDP_HEADER_SIZE = 28
+
+#The socket options for the don't fragment bit and the path MTU. Python doesn't
+#have names for all of them, so we'll use the numbers from the Linux headers
+IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)
+IP_PMTUDISC_DO = getattr(socket, 'IP_PMTUDISC_DO', 2)
+IP_MTU = getattr(socket, 'IP_MTU', 14)
+
+#The largest sequence number that fits in the version 1 header
+MAX_SEQ_V1 = 0xFFFF
+
+#How much of the file is hashed at the time for the digest that is sent in the FIN
+DIGEST_CHUNK = 4 * 1024 * 1024
+#How much of the start and the end of the file is hashed for its id
+FILE_ID_SAMPLE = 1024 * 1024
+
+#How much of the file has to be acknowledged before we tell the system
+#that it can drop those pages of the memory-mapped file
+RELEASE_CHUNK = 4 * 1024 * 1024
+
+#The packets a SACK bitmap says the server has, from the lowest. Bit i of the bitmap,
+#counted from the lowest bit of the first byte, is packet ack_num + 2 + i, since the
+#packet right after ack_num is the one the server is missing
+def sacked_packets(ack_num, bitmap):
+    bits = int.from_bytes(bitmap, 'little')
+    packets = []
+    while bits:
+        lowest = bits & -bits
+        packets.append(ack_num + 1 + lowest.bit_length())
+        bits ^= lowest
+    return packets
+
+#Memory-mapping the file we are sending, so the packets can be sent straight
+#from the file's pages without reading the data into new bytes objects.
+#It gives back the map and a memoryview of it. Slicing the memoryview doesn't copy
+#anything, so a packet can be found again by its sequence number when it has to be resent.
+#An empty file can't be mapped, so then we'll just use an empty memoryview.
+#If we only send a part of the file, the memoryview only covers length bytes from offset
+@contextmanager
+def map_file(file, offset=0, length=None):
+    if os.fstat(file.fileno()).st_size == 0:
+        yield None, memoryview(b'')
+        return
+    mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        #Telling the system that we read the file from start to end, so it can read ahead
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mm)
+    part = view[offset:None if length is None else offset + length]
+    try:
+        yield mm, part
+    finally:
+        #The memoryviews have to be released before the map can be closed
+        part.release()
+        view.release()
+        mm.close()
+
+#Sending the packet with the given sequence number. The header and the slice of the
+#file are given to sendmsg as two buffers, so the data is never copied in Python.
+#On systems without sendmsg we'll have to put them together first.
+#header is a bytearray of the header size of the version, which the header is packed
+#into with the precompiled struct, so the same buffer can be used for every packet.
+#Without it a new one is made. The socket has to be connected to the server.
+#Returns the length of the data in the packet
+def send_segment(sock, view, seq_num, version, payload_size=PAYLOAD_SIZE, header=None):
+    offset = (seq_num - 1) * payload_size
+    data = view[offset:offset + payload_size]
+    if header is None:
+        header = bytearray(HEADER_SIZES[version])
+    if version == 3:
+        header_v3.pack_into(header, 0, 3, 0, len(data), seq_num, 0, packet_checksum(seq_num, 0, 0, data))
+    elif version == 2:
+        header_v2.pack_into(header, 0, 2, 0, len(data), seq_num, 0)
+    else:
+        header_v1.pack_into(header, 0, seq_num, 0, 0)
+    if hasattr(sock, 'sendmsg'):
+        sock.sendmsg([header, data])
+    else:
+        sock.send(header + data)
+    return len(data)
+
+#Putting the packet with the given sequence number in the batch, which sends
+#many packets with one system call when it is flushed. Without a batch
+#the packet is sent right away. Returns the length of the data in the packet
+def queue_segment(sock, batch, view, seq_num, version, payload_size, header=None):
+    if batch is None:
+        return send_segment(sock, view, seq_num, version, payload_size, header)
+    offset = (seq_num - 1) * payload_size
+    length = min(payload_size, len(view) - offset)
+    checksum = packet_checksum(seq_num, 0, 0, view[offset:offset + length]) if version == 3 else 0
+    batch.add(offset, length, *header_values(seq_num, 0, 0, length, version, checksum))
+    return length
+
+#The packets before the base are acknowledged and will never be sent again,
+#so the system can drop their pages from the map. That way only the pages of the
+#window stay in memory, also for files much larger than the memory.
+#released is how far the pages are dropped already, and the new value is returned
+def release_pages(mm, released, acked_bytes):
+    end = acked_bytes - acked_bytes % mmap.PAGESIZE
+    if end > released and hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+        mm.madvise(mmap.MADV_DONTNEED, released, end - released)
+    return max(end, released)
+
+#Sending one probe packet of the given size and waiting for the server to tell us
+#how large it was when it got it. The probe is sent twice in case it is just lost.
+#Returns True if the whole packet got through
+def send_probe(sock, size):
+    probe = create_packet(0, size, PROBE, bytes(size - HEADER_SIZES[1]))
+    sock.settimeout(TIMEOUT)
+    for attempt in range(2):
+        try:
+            sock.send(probe)
+        except OSError:
+            #The packet is larger than the MTU we know of, and with
+            #the don't fragment bit set the system won't send it
+            return False
+        try:
+            while True:
+                reply, _ = sock.recvfrom(1024)
+                _, ack_num, flags, _ = parse_packet(reply)
+                #If the server got less than we sent, the probe was cut off on the way
+                #or by the server, and then there is no need to wait for more
+                if flags & PROBE:
+                    return ack_num == size
+        except socket.timeout:
+            continue
+    return False
+
+#Finding the largest packet that gets to the server without being split into fragments.
+#The don't fragment bit is set, so routers drop the packets that are too large instead
+#of splitting them. We'll first try the largest packet the system thinks will fit, which
+#almost always gets through, and else search for the largest one that does.
+#It only works on Linux, and returns the largest packet size or None
+def probe_path_mtu(sock, max_size):
+    if not sys.platform.startswith('linux'):
+        print("Path MTU probing is only supported on Linux")
+        return None
+    old_setting = sock.getsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER)
+    sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    low = MIN_PROBE_SIZE
+    high = max_size
+    try:
+        #The MTU the system knows for the path to the server
+        high = min(high, sock.getsockopt(socket.IPPROTO_IP, IP_MTU) - IP_UDP_HEADER_SIZE)
+    except OSError:
+        pass
+    best = None
+    size = high
+    try:
+        while low <= high:
+            if send_probe(sock, size):
+                best = size
+                low = size + 1
+            else:
+                high = size - 1
+            size = (low + high + 1) // 2
+    finally:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, old_setting)
+    return best
+
+#Estimating the retransmission timeout from the measured round trip times,
+#the same way as TCP does it (Jacobson's algorithm, RFC 6298).
+#srtt is the smoothed RTT and rttvar is how much the RTT varies.
+#The rtt dictionary holds the srtt, rttvar and rto of the connection.
+#The measurement is also counted in the RTT histogram of the metrics
+def update_rtt(rtt, sample, metrics=None):
+    if metrics is not None:
+        record_rtt(metrics, sample)
+    if rtt['srtt'] is None:
+        #The first measurement is used as it is
+        rtt['srtt'] = sample
+        rtt['rttvar'] = sample / 2
+    else:
+        #The variance has to be updated with the old srtt, so it comes first
+        rtt['rttvar'] = 0.75 * rtt['rttvar'] + 0.25 * abs(rtt['srtt'] - sample)
+        rtt['srtt'] = 0.875 * rtt['srtt'] + 0.125 * sample
+    #A new measurement also undoes the exponential backoff
+    reset_backoff(rtt)
+
+#Setting the RTO back to what the RTT estimates say. This is done on every new
+#measurement, and also when an ACK moves the window forward. Otherwise the RTO
+#would stay backed off after a loss when all the ACKs are for resent packets
+def reset_backoff(rtt):
+    if rtt['srtt'] is not None:
+        rtt['rto'] = min(max(rtt['srtt'] + 4 * rtt['rttvar'], MIN_RTO), MAX_RTO)
+
+#When a timer runs out the packet was probably lost because the network is
+#congested, so we'll double the RTO to not make it worse (exponential backoff)
+def backoff_rto(rtt):
+    rtt['rto'] = min(rtt['rto'] * 2, MAX_RTO)
+    rtt['backoffs'] += 1
+
+#Congestion control in the style of TCP (New)Reno. The cc dictionary holds
+#the congestion window (cwnd) and slow start threshold (ssthresh) in packets.
+#The window given by the user (-w) is the upper limit of the cwnd.
+#Every ACK that acknowledges new packets makes the window grow, by one packet per
+#packet in slow start (doubling every RTT) and by one packet per RTT after that
+def cc_on_ack(cc, acked):
+    if cc['cwnd'] < cc['ssthresh']:
+        cc['cwnd'] += acked
+    else:
+        cc['cwnd'] += acked / cc['cwnd']
+    cc['cwnd'] = min(cc['cwnd'], cc['max'])
+    cc['max_cwnd'] = max(cc['max_cwnd'], cc['cwnd'])
+
+#When a packet is lost the window is halved. After a fast retransmit we'll go on
+#from half the window, but after a timeout we'll start over with slow start from 1.
+#in_flight is the number of packets that were sent but not acknowledged, and
+#next_seq_num is used so the window is only halved once per window of losses
+def cc_on_loss(cc, in_flight, next_seq_num, base, timeout):
+    if not timeout and base < cc['recover']:
+        return
+    cc['ssthresh'] = max(in_flight / 2, 2)
+    cc['cwnd'] = 1 if timeout else min(cc['ssthresh'], cc['max'])
+    cc['recover'] = next_seq_num
+    cc['trace'].append((round(time.time() - cc['start'], 3), int(cc['cwnd'])))
+
+#A token bucket that lets rate bytes per second through. The tokens grow with the time,
+#up to what the rate gives in BURST_TIME, and a packet can be sent while there are any.
+#A packet takes the tokens for all of its bytes, so they can go below zero, and then
+#the next packet has to wait until they are back
+def new_bucket(rate):
+    return {'rate': rate, 'tokens': rate * BURST_TIME, 'time': time.time()}
+
+#How many seconds until the bucket lets the next packet through
+def bucket_delay(bucket):
+    now = time.time()
+    bucket['tokens'] = min(bucket['tokens'] + (now - bucket['time']) * bucket['rate'], bucket['rate'] * BURST_TIME)
+    bucket['time'] = now
+    return 0 if bucket['tokens'] > 0 else -bucket['tokens'] / bucket['rate']
+
+#How many seconds until the next packet may be sent. The pacer spreads the window over
+#the RTT, so its rate follows the cwnd and the RTT. Before the first RTT is measured
+#only the rate limit counts
+def send_delay(pacer, limiter, cc, rtt, packet_size):
+    delay = 0
+    if pacer is not None and rtt['srtt']:
+        gain = PACING_GAIN_SLOW_START if cc['cwnd'] < cc['ssthresh'] else PACING_GAIN
+        pacer['rate'] = gain * cc['cwnd'] * packet_size / rtt['srtt']
+        delay = bucket_delay(pacer)
+    if limiter is not None:
+        delay = max(delay, bucket_delay(limiter))
+    return delay
+
+#Taking the tokens for size bytes that were sent, also when they were sent again
+def spend_tokens(pacer, limiter, size):
+    if pacer is not None:
+        pacer['tokens'] -= size
+    if limiter is not None:
+        limiter['tokens'] -= size
+
+#The values of a transfer that change all the time, for the snapshots of the metrics
+def transfer_state(rtt, cc, in_flight):
+    state = {'cwnd': round(cc['cwnd'], 2), 'max_cwnd': round(cc['max_cwnd'], 2), 'ssthresh': round(cc['ssthresh'], 2),
+             'in_flight': in_flight, 'rto_ms': round(rtt['rto'] * 1000, 3)}
+    if rtt['srtt'] is not None:
+        state['srtt_ms'] = round(rtt['srtt'] * 1000, 3)
+        state['rttvar_ms'] = round(rtt['rttvar'] * 1000, 3)
+    return state
+
+#Waiting for a packet from the server without stopping the other transfers on the
+#event loop. If a packet is already waiting we take it right away, else the event
+#loop tells us when the socket has something for us. If nothing comes within
+#timeout seconds, socket.timeout is raised just like on a socket with a timeout.
+#The socket is connected, so when nobody listens on the server's port (it hasn't started
+#or is restarting) the ICMP port unreachable comes back as ConnectionRefusedError. That is
+#handled like a lost packet, and we go on waiting for the rest of the timeout
+async def receive(sock, timeout, size=1024):
+    try:
+        return sock.recv(size, MSG_DONTWAIT)
+    except (BlockingIOError, ConnectionRefusedError):
+        pass
+    loop = asyncio.get_running_loop()
+    fd = sock.fileno()
+    deadline = time.time() + timeout
+    while True:
+        ready = loop.create_future()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, max(deadline - time.time(), 0))
+        except asyncio.TimeoutError:
+            raise socket.timeout("timed out")
+        finally:
+            loop.remove_reader(fd)
+        try:
+            return sock.recv(size, MSG_DONTWAIT)
+        except (BlockingIOError, ConnectionRefusedError):
+            pass
+
+#An id that tells this file apart from other files, and from other versions of it,
+#so the server only resumes an interrupted transfer of the very same file.
+#Hashing all of a large file would take about as long as sending it, so we only hash
+#the size, the time it was last changed and the first and last megabyte
+def file_id(file_name):
+    stat = os.stat(file_name)
+    digest = hashlib.sha256("{}:{}".format(stat.st_size, stat.st_mtime_ns).encode())
+    with open(file_name, 'rb') as file:
+        digest.update(file.read(FILE_ID_SAMPLE))
+        if stat.st_size > FILE_ID_SAMPLE:
+            file.seek(max(stat.st_size - FILE_ID_SAMPLE, FILE_ID_SAMPLE))
+            digest.update(file.read(FILE_ID_SAMPLE))
+    return digest.hexdigest()[:32]
+
+#Finding the largest packet that gets through to the server, on a socket of its own
+#so it is only done once even when we send many files. Returns the data size to use
+def probe_payload_size(server_address, payload_size):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(server_address)
+    try:
+        largest = probe_path_mtu(sock, header_size_v3 + MAX_PAYLOAD)
+    finally:
+        sock.close()
+    if largest is None:
+        print("Path MTU probing failed, using {} bytes of data per packet".format(payload_size))
+        return payload_size
+    print("The largest packet that gets through is {} bytes, using {} bytes of data per packet".format(largest, largest - header_size_v3))
+    return largest - header_size_v3
+
+#Giving up on a connection before any data is sent. No FIN is sent, so the server
+#doesn't take the file for a whole one, and it closes the connection when it goes quiet.
+#resources holds the socket and the file, which are closed
+def give_up(resources, metrics, stats):
+    resources.close()
+    metrics['end'] = time.time()
+    emit(stats, snapshot(metrics, final=True, completed=False))
+    return False
+
+#Sending one file to the server. All the waiting is done on the event loop, so
+#many files can be sent at the same time, each on its own socket and connection.
+#With a length only that many bytes from offset are sent, as one stripe of the file.
+#extra_options are put in the SYN, and on_connect is called with the server's options
+#when the connection is established. With compression ('zlib', 'lzma' or 'zstd') the data
+#is compressed on the way if the server knows the method and the file gets smaller.
+#With pace the packets are spread over the RTT instead of sent as a whole window at once, and
+#rate is the most Mbit/s to send. limiter is a token bucket to share the rate with other transfers.
+#Returns True if the server acknowledged the FIN, which means it has all of the file,
+#and with header version 3 that it checked the digest of the file
+async def send_file(file_name, server_address, window_size, arq='gbn', dup_ack_threshold=DUP_ACK_THRESHOLD, congestion_control='none',
+                    payload_size=None, batching=True, offset=0, length=None, extra_options=None, on_connect=None,
+                    verbosity=INFO, stats=None, stats_interval=0, compression=None, compression_level=None,
+                    pace=False, rate=None, limiter=None):
+    #Creating a UDP socket
+    #AF_INET indicates that the underlying network is using IPv4
+    #SOCK_DGRAM indicates that it is a UDP socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    #Connecting the socket to the server. For UDP this doesn't send anything, but
+    #the address doesn't have to be given and looked at again for every packet we send,
+    #and we'll only get packets from the server
+    sock.connect(server_address)
+
+    payload_size = min(payload_size or PAYLOAD_SIZE, MAX_PAYLOAD)
+    #Printing a line for every packet is slow, so it is only done when asked for
+    trace = verbosity >= TRACE
+    #Counting what happens to the transfer. The counters are written to the stats
+    #file at the end, and every stats_interval seconds if it is given
+    metrics = new_metrics('client', file=file_name, server="{}:{}".format(*server_address))
+    if length is not None:
+        metrics['offset'] = offset
+    #The socket and the file are closed together when we are done or give up
+    resources = ExitStack()
+    resources.callback(sock.close)
+
+    #The file is opened and mapped before the SYN, so a file that is missing or can't be
+    #read is found before the server is asked to make room for it
+    try:
+        file = resources.enter_context(open(file_name, "rb"))
+        mm, whole = resources.enter_context(map_file(file))
+    except (OSError, ValueError) as e:
+        print("{} can't be read ({})".format(file_name, e))
+        return give_up(resources, metrics, stats)
+
+    #Establish connection:
+    #Establishing the three-way handshake before sending any data
+    #to make sure that the server is alive and we can connect
+    #We will therefore send a SYN packet to initiate connection
+    #which is the first step in the 3-way handshake
+    #The sequence number and acknowledgment number is set
+    #to be 0 to start with
+    #We'll create a variable client_seq_num and set it to 0
+    #so we can later use it for handling the incrementing
+    #of the sequence numbers
+    #The sequence number and acknowledgement number correspondans:
+    #SYN: client_seq = 0, client_ack = 0
+    #SYN-ACK: server_seq = 0, server_ack = client_seq + 1 = 1
+    #ACK: client_seq = server_ack = 1, client_ack = server_seq + 1 = 1
+    #If Selective Repeat is wanted we'll also set the SR flag in the SYN
+    #so the server knows that it has to buffer out of order packets
+    #The data of the SYN holds our options as JSON: the newest header version
+    #we know, so the server can pick the one we both know, how much data we
+    #want to send in each packet, and the name and size of the file so the
+    #server can save it and make room for it
+    client_seq_num = 0
+    client_ack_num = 0
+    syn_flags = SYN | SR if arq == 'sr' else SYN
+    syn_options = {'version': HEADER_VERSION, 'mss': payload_size}
+    #We understand cumulative ACKs with a SACK bitmap, and the server may wait for a few packets before it sends one
+    syn_options.update(sack=True, ack_every=max(min(ACK_EVERY, window_size // 4), 1))
+    syn_options['name'] = os.path.basename(file_name)
+    syn_options['size'] = len(whole)
+    #The id lets the server resume the file if this transfer is interrupted
+    if length is None:
+        syn_options['id'] = file_id(file_name)
+    #We only ask for compression if a sample of the file gets small enough
+    if compression and compression not in compression_methods():
+        print("{} isn't available here, sending {} as it is".format(compression, file_name))
+    elif compression:
+        part = syn_options['size'] - offset if length is None else length
+        if worth_compressing(file_name, offset, part, compression, compression_level):
+            syn_options['compression'] = compression
+        else:
+            log(verbosity, INFO, "{} doesn't get smaller with {}, sending it as it is".format(file_name, compression))
+    #A stripe tells the server where in the file its data goes
+    if length is not None:
+        syn_options['offset'] = offset
+    if extra_options:
+        syn_options.update(extra_options)
+    syn_packet = create_packet(client_seq_num, client_ack_num, syn_flags, json.dumps(syn_options).encode())
+
+    #Holding the estimated round trip time and the RTO of the connection,
+    #which starts at TIMEOUT until the first measurement. backoffs counts the timeouts
+    #since we last heard from the server
+    rtt = {'srtt': None, 'rttvar': None, 'rto': TIMEOUT, 'backoffs': 0}
+
+    #The SYN or the SYN-ACK can be lost, or the server can be busy with many other
+    #clients, so we'll send the SYN again with the same backoff as the data packets
+    for attempt in range(SYN_RETRIES):
+        sock.send(syn_packet)
+        #Following Karn's algorithm we only measure the RTT if the SYN wasn't resent
+        syn_time = time.time() if attempt == 0 else None
+        log(verbosity, INFO, "SYN packet sent")
+        try:
+            #Receiving response from the server, which in this case
+            #should be a SYN-ACK packet. This is the second step in the
+            #3-way handshake.
+            #The server will send over a packet and the server address
+            #since we are only interested in the packet we'll not assign
+            #the server address from the tuple to anything
+            response = await receive(sock, rtt['rto'])
+            #A late answer to one of our probes can come before the SYN-ACK
+            while parse_packet(response)[2] & PROBE:
+                response = await receive(sock, rtt['rto'])
+            break
+        except socket.timeout:
+            backoff_rto(rtt)
+    else:
+        print("No SYN-ACK received, the server doesn't answer")
+        return give_up(resources, metrics, stats)
+
+    #To find out what kind of packet is sent from server we'll
+    #have to look at the flag. Therefor we will have to parse 
+    #the packet sent from the server. The parse_packet function
+    #will return a tuple of values extracted from the packet,
+    #but in this case we are just interessted in what the 
+    #flags and sequence number, acknowledgement field is holding. 
+    #The sequence number and acknowledgment number
+    #received from the server will be handled
+    #to exchange the right numbers in the 3 way handshake
+    server_seq_num, server_ack_num, flags, syn_ack_data = parse_packet(response)
+
+    #The server answers with the options it agrees on. An older server
+    #doesn't send any, and then we have to use header version 1 and 994 bytes of data
+    server_options = json.loads(bytes(syn_ack_data)) if syn_ack_data else {}
+    version = server_options.get('version', 1)
+    if server_options.get('mss', PAYLOAD_SIZE) != payload_size:
+        log(verbosity, INFO, "The server wants {} bytes of data per packet instead of {}".format(server_options.get('mss', PAYLOAD_SIZE), payload_size))
+    payload_size = server_options.get('mss', PAYLOAD_SIZE)
+    #The server already has the start of the file from a transfer that was interrupted,
+    #so we only send the rest of it. It is sent like a stripe that starts where the server is
+    if length is None and server_options.get('resume'):
+        offset = server_options['resume']
+        length = len(whole) - offset
+        metrics['resumed_from'] = offset
+        log(verbosity, INFO, "The server already has {} bytes of the file, sending the last {}".format(offset, length))
+    #A stripe or a resumed file is only part of the file, and the digest the server
+    #checks in the end only covers the bytes of it we send
+    sent_part = (length, offset) if length is not None else None
+    #The server answers with the compression method if it knows it, and else the file is sent as it is
+    if 'compression' in syn_options and server_options.get('compression') != syn_options['compression']:
+        log(verbosity, INFO, "The server can't decompress {}, sending the file as it is".format(syn_options['compression']))
+    compression = server_options.get('compression') if 'compression' in syn_options else None
+    if compression is not None:
+        metrics['compression'] = compression
+    #With SACK every ACK acknowledges all the packets up to its number, and has a bitmap of
+    #the packets after the missing one that the server has. Without it every ACK in Selective
+    #Repeat is for one packet only
+    sack = bool(server_options.get('sack'))
+
+    #We have to check if the received flags is a SYN-ACK. For
+    #that we'll compare the variable flags that holds the info
+    #extracted from the packet (parse_packet function).
+    #If the server has sent a SYN-ACK, we'll go to the last
+    #step of the 3-way handshake which is to send the ACK-packet
+    if flags & (SYN | ACK):
+        log(verbosity, INFO, "SYN-ACK packet is received")
+        #The time from the SYN to the SYN-ACK is our first RTT measurement
+        if syn_time is not None:
+            update_rtt(rtt, time.time() - syn_time, metrics)
+
+        #Sending an ACK packet to confirm that the connection
+        #is established
+        #The sequence number is incremented by 1 to acknowledge the server's SYN
+        #The client sequence number will be equal to the server acknowledgement number
+        #to tell the server that it's SYN-ACK packet was received
+        #The client acknowledgment number will be equal to the server sequence number + 1
+        sock.send(create_packet(server_ack_num, server_seq_num + 1, ACK, version=version))
+        log(verbosity, INFO, "ACK packet sent")
+        log(verbosity, INFO, "Connection established, using header version {}".format(version))
+
+        #The server echoes the SR flag back if it agrees on Selective Repeat.
+        #An older server that only knows Go-Back-N won't do that, so we fall back
+        if arq == 'sr' and not flags & SR:
+            log(verbosity, INFO, "Server does not support Selective Repeat, falling back to Go-Back-N")
+            arq = 'gbn'
+
+    #With header version 1 the sequence numbers can't go above 65535, and the FIN needs one as well
+    if version == 1 and len(whole) > (MAX_SEQ_V1 - 1) * payload_size:
+        print("The file is too large for header version 1, which is the only version the server knows")
+        return give_up(resources, metrics, stats)
+    #A server that doesn't know about stripes would write this one at the start of the file
+    if 'offset' in syn_options and server_options.get('offset') != offset:
+        print("The server can't put a file together from stripes")
+        return give_up(resources, metrics, stats)
+
+    #We'll handle the data transfer part
+    log(verbosity, INFO, "\nData Transfer:")
+
+    #Base is used to manage and track which packets have been sent and which are still
+    #awaiting acknowledgment. When an ACK is received, base is updated so that it points
+    #to the next sequence number that has not been acknowledged. This ensures that the 
+    #window moves appropriately and that data transmission continues efficiently and reliably
+    base = client_seq_num + 1
+
+    #next_seq_num is initialized at the start of the transmission (set to the same initial value as base, 
+    #but will be incremented before sending the first packet). As data is sent over the network, 
+    #next_seq_num is incremented after each packet dispatch
+    next_seq_num = base
+
+    #window is a important component for managing the flow of data packets between 
+    #the sender and the receiver. It holds the length of the data in each packet,
+    #the data itself stays in the memory-mapped file
+    window = {}
+
+    #send_times holds the last time each packet in the window was sent.
+    #In Selective Repeat every packet has its own timer, so we'll also keep a queue
+    #of (send time, sequence number) in the order the packets were sent. Since the
+    #time only goes forward the oldest timer is always first in the queue
+    send_times = {}
+    timers = deque()
+    #The packets that have been resent. Following Karn's algorithm we can't measure
+    #the RTT from these, since we don't know which of the copies the ACK belongs to
+    resent = set()
+    #Counting the duplicate ACKs for the oldest unacknowledged packet (fast retransmit)
+    dup_acks = 0
+
+    #The congestion control state. Without congestion control the cwnd is just the fixed window.
+    #trace keeps the time and the new cwnd every time the window is reduced
+    use_cc = congestion_control == 'reno'
+    cc = {'cwnd': min(INITIAL_CWND, window_size) if use_cc else window_size, 'ssthresh': window_size,
+          'max': window_size, 'max_cwnd': 0, 'recover': 0, 'trace': [], 'start': time.time()}
+    cc['max_cwnd'] = cc['cwnd']
+    #In Go-Back-N there is only one timer for the oldest unacknowledged packet
+    timer_start = time.time()
+    #When the next snapshot of the metrics is written
+    next_sample = time.time() + stats_interval
+    #The digest of the data we sent, which the server checks against its file before
+    #it acknowledges the FIN. It is only sent when all of the data is acknowledged
+    file_digest = None
+    #The compressed data, when the file is compressed on the way
+    stream = None
+    #Why the transfer was given up, when the server sent an RST or stopped answering.
+    #Then no FIN is sent, since the server won't take the file as a whole one anyway
+    failed = None
+    #The token buckets for pacing and the rate limit. paced tells if the sending has to ask them
+    pacer = new_bucket(1) if pace else None
+    if limiter is None and rate:
+        limiter = new_bucket(rate * 1000000 / 8)
+    paced = pacer is not None or limiter is not None
+    if pace:
+        metrics['pacing'] = True
+    if rate:
+        metrics['rate_limit_mbps'] = rate
+    #The packets are counted with their header for the rate
+    packet_size = payload_size + HEADER_SIZES[version]
+
+    #We'll start with an attempt to open and read from a file in the try. File operations can 
+    #fail for various reasons such as the file not existing, lack of permissions, or issues 
+    #with the file system. By placing these operations within a try block, the program can 
+    #handle such errors gracefully instead of crashing.
+    try:
+        #To handle the jpeg file we'll open the file in
+        #binary mode rb, read the data and return them
+        #as a bytes string which will be sent over the
+        #DRTP/UDP conncetion to the server
+        if on_connect is not None:
+            on_connect(server_options)
+        #The part of the file we send. The view is let go before the map is closed
+        with whole[offset:None if length is None else offset + length] as view:
+            #The file is sent in blocks of 994 bytes as specified in the assignment,
+            #or of the size we agreed on with the server
+            #Worth to know:
+            #I have checked and found out that the jpeg file is 1.74 Mb.
+            #If we calculate Mb to bytes the file's size will be 1 825 792 bytes.
+            #Since we'll only be sending 994 bytes at the time, that will
+            #make approximatly 1838 packets to send :o
+            last_seq_num = (len(view) + payload_size - 1) // payload_size
+            #Where the view starts in the map
+            map_offset = offset
+            #With compression the packets are sent from the compressed data instead of from the
+            #file. It is made while we send, so we only know how many packets there are at the end
+            stream_done = True
+            if compression is not None:
+                stream = CompressedStream(file_name, offset, len(view), compression, compression_level).start()
+                mm, view, map_offset = stream.mm, stream.view, 0
+                last_seq_num, stream_done = stream.packets(payload_size)
+            #How far the pages of the map have been dropped. The pages are dropped from the
+            #start of a page, and a stripe may start in the middle of one
+            released = map_offset - map_offset % mmap.PAGESIZE
+            #With header version 3 the data is hashed as it is acknowledged, a few megabytes at
+            #the time, while its pages still are in memory. hashed is how far we have come.
+            #Compressed data is hashed by the compressor before it is compressed
+            digest = hashlib.sha256() if version == 3 and stream is None else None
+            hashed = 0
+            #On Linux the new packets in the window are sent together with one system call.
+            #batch is None when the packets are sent one by one
+            batch = None
+            if batching and batchio.available():
+                batch = batchio.SendBatch(sock, view, HEADER_FORMATS[version])
+            #Without the batch every packet is sent on its own, and its header is packed into this buffer
+            header = bytearray(HEADER_SIZES[version])
+
+            #Resending a packet that is most likely lost. It is queued in the batch, which the
+            #caller flushes when it is done resending. Following Karn's algorithm the packet is
+            #marked as resent so no RTT is measured from it, and in Selective Repeat it gets a new timer
+            def resend(seq):
+                queue_segment(sock, batch, view, seq, version, payload_size, header)
+                now = time.time()
+                send_times[seq] = now
+                if arq == 'sr':
+                    timers.append((now, seq))
+                resent.add(seq)
+                metrics['packets_sent'] += 1
+                metrics['retransmissions'] += 1
+                if paced:
+                    spend_tokens(pacer, limiter, packet_size)
+            #We'll continue until all data is sent and acknowledged
+            while next_seq_num <= last_seq_num or window or not stream_done:
+                if stream is not None:
+                    last_seq_num, stream_done = stream.packets(payload_size)
+                    #When all of it is compressed the view gets the right length, so the last packet isn't too long
+                    if stream_done and view is stream.view:
+                        view = stream.data()
+                    #Everything compressed so far is sent and acknowledged, so we wait for more
+                    if next_seq_num > last_seq_num and not window:
+                        if not stream_done:
+                            await stream.wait()
+                        continue
+                #We have to make sure to send data while the window is not full and there is data to send
+                #This is the first key component of the Go-Back-N where we are managing packet sending and
+                #window managment
+                while next_seq_num < base + int(cc['cwnd']) and next_seq_num <= last_seq_num:
+                    #The pacer or the rate limit may hold the packet back for a while
+                    if paced and send_delay(pacer, limiter, cc, rtt, packet_size) > 0:
+                        break
+                    #Sending the packet with the current sequence number and its data to the server
+                    length = queue_segment(sock, batch, view, next_seq_num, version, payload_size, header)
+                    metrics['packets_sent'] += 1
+                    if paced:
+                        spend_tokens(pacer, limiter, packet_size)
+                    #We'll have to log the packet sending action with the time, sequence number and sliding window
+                    #to keep on track which packet is sent etc
+                    if trace:
+                        print(f"{timestamp()} -- packet with seq = {next_seq_num} is sent, sliding window = {list(window.keys())}, cwnd = {cc['cwnd']:.1f}")
+                    #Update the window list by adding the sent packet
+                    window[next_seq_num] = length
+                    #Starting the timer for the packet. Only Selective Repeat takes the timers
+                    #off the queue again, Go-Back-N has the one timer for the base
+                    now = time.time()
+                    send_times[next_seq_num] = now
+                    if arq == 'sr':
+                        timers.append((now, next_seq_num))
+                    if next_seq_num == base:
+                        timer_start = now
+                    #Increment the sequence number
+                    next_seq_num += 1
+                #Sending the packets that are waiting in the batch
+                if batch is not None:
+                    batch.flush()
+
+                #Finding out when the next timer expires so we only wait for ACKs until then
+                if arq == 'sr':
+                    #Throwing away timers for packets that are acknowledged or has been resent
+                    while timers and send_times.get(timers[0][1]) != timers[0][0]:
+                        timers.popleft()
+                    deadline = timers[0][0] + rtt['rto'] if timers else time.time() + rtt['rto']
+                else:
+                    deadline = timer_start + rtt['rto']
+                timeout = max(deadline - time.time(), 0)
+                #With pacing we wake up when the next packet may be sent, if there is one waiting
+                if paced and next_seq_num < base + int(cc['cwnd']) and next_seq_num <= last_seq_num:
+                    timeout = min(timeout, send_delay(pacer, limiter, cc, rtt, packet_size))
+
+                #We have to handle the acknowledgments from the server as well
+                #This is the second key component of the Go-Back-N where we are handling the
+                #received acknowledgements and updating the servers window
+                try:
+                    #Receive an acknowledgment packet from the server
+                    #which tells us that the server received the sent packet
+                    #We'll only have use for the ack_packet not the address server is sending
+                    ack_packet = await receive(sock, timeout)
+                    #Parse the acknowledgment packet. We'll only need the ack_num 
+                    #containing the acknowledgement number and ack_flags containting
+                    #the ACK flag
+                    parsed = parse_checked(ack_packet) if version == 3 else parse_packet(ack_packet, version)
+                    _, ack_num, ack_flags, ack_data = parsed or (0, 0, 0, b'')
+                    #A damaged ACK is thrown away like a lost one
+                    if parsed is None:
+                        metrics['corrupt_packets'] += 1
+                    #The server has given up the connection and won't take any more of the file
+                    elif ack_flags & RST:
+                        failed = "The server has given up the connection, stopping the transfer"
+                        break
+                    #Check if the packet is an ACK
+                    elif ack_flags & ACK:
+                        metrics['acks_received'] += 1
+                        #The server is still there, even if the ACK doesn't move the window
+                        rtt['backoffs'] = 0
+                        #We'll have to log the packet received action with the time, acknowledgment
+                        #number to keep on track with the acknowledgment receipt
+                        if trace:
+                            print(f"{timestamp()} -- ACK for packet = {ack_num} is received")
+
+                        if arq == 'sr' and sack:
+                            #The ACK tells about every packet up to ack_num and the ones in the bitmap,
+                            #so one ACK can acknowledge many packets and show many holes
+                            sacked = sacked_packets(ack_num, ack_data)
+                            acked = [seq for seq in range(base, ack_num + 1) if seq in window]
+                            acked += [seq for seq in sacked if seq in window]
+                            newest = None
+                            for seq in acked:
+                                window.pop(seq)
+                                sent_time = send_times.pop(seq)
+                                if seq not in resent and (newest is None or seq > newest[0]):
+                                    newest = (seq, sent_time)
+                                resent.discard(seq)
+                            #The RTT is measured from the newest packet the ACK is for, which is
+                            #usually the one that made the server send it
+                            if newest is not None:
+                                update_rtt(rtt, time.time() - newest[1], metrics)
+                            if use_cc and acked:
+                                cc_on_ack(cc, len(acked))
+                            #The server has packets after the base while the base is missing, which
+                            #counts as a duplicate ACK
+                            if sacked and base in window:
+                                dup_acks += 1
+                                metrics['duplicate_acks'] += 1
+                            if base not in window:
+                                dup_acks = 0
+                                reset_backoff(rtt)
+                            while base < next_seq_num and base not in window:
+                                base += 1
+                            #Fast retransmit: every hole in front of the last packet the server has
+                            #is most likely lost, so they are all resent at once. The ones that are
+                            #resent already are left to their timers
+                            if dup_ack_threshold and dup_acks == dup_ack_threshold and sacked:
+                                holes = [seq for seq in range(base, sacked[-1]) if seq in window and seq not in resent]
+                                for seq in holes:
+                                    if trace:
+                                        print(f"{timestamp()} -- {dup_acks} duplicate ACKs, fast retransmit of packet with seq = {seq}")
+                                    resend(seq)
+                                if batch is not None:
+                                    batch.flush()
+                                if holes:
+                                    metrics['fast_retransmits'] += 1
+                                    if use_cc:
+                                        cc_on_loss(cc, next_seq_num - base, next_seq_num, base, False)
+                        elif arq == 'sr':
+                            #In Selective Repeat the server acknowledges every packet on its own,
+                            #so we'll only remove the acknowledged packet from the window
+                            if ack_num in window:
+                                window.pop(ack_num)
+                                sent_time = send_times.pop(ack_num)
+                                if ack_num not in resent:
+                                    update_rtt(rtt, time.time() - sent_time, metrics)
+                                resent.discard(ack_num)
+                                if use_cc:
+                                    cc_on_ack(cc, 1)
+                                #An ACK for a packet after the base means that packets behind it
+                                #got through while the base did not. This counts as a duplicate ACK
+                                if ack_num != base:
+                                    dup_acks += 1
+                                    metrics['duplicate_acks'] += 1
+                            #The base is moved to the oldest packet that is still not acknowledged
+                            if base not in window:
+                                dup_acks = 0
+                                reset_backoff(rtt)
+                            while base < next_seq_num and base not in window:
+                                base += 1
+                            #Fast retransmit: the base is most likely lost, so we'll resend
+                            #it now instead of waiting for its timer to run out. dup_acks is 0 right
+                            #after the base has moved, so a threshold of 0 has to turn this off
+                            if dup_ack_threshold and dup_acks == dup_ack_threshold and base in window:
+                                if trace:
+                                    print(f"{timestamp()} -- {dup_acks} duplicate ACKs, fast retransmit of packet with seq = {base}")
+                                resend(base)
+                                if batch is not None:
+                                    batch.flush()
+                                metrics['fast_retransmits'] += 1
+                                if use_cc:
+                                    cc_on_loss(cc, next_seq_num - base, next_seq_num, base, False)
+                        elif ack_num == base - 1 and window:
+                            #The server acknowledges the last packet it got in order again when
+                            #a packet arrives out of order, so this is a duplicate ACK
+                            dup_acks += 1
+                            metrics['duplicate_acks'] += 1
+                            #Fast retransmit: resending the window without waiting for the timer
+                            if dup_acks == dup_ack_threshold:
+                                metrics['fast_retransmits'] += 1
+                                for seq in range(base, next_seq_num):
+                                    if trace:
+                                        print(f"{timestamp()} -- {dup_acks} duplicate ACKs, fast retransmit of packet with seq = {seq}")
+                                    resend(seq)
+                                if batch is not None:
+                                    batch.flush()
+                                timer_start = time.time()
+                                if use_cc:
+                                    cc_on_loss(cc, next_seq_num - base, next_seq_num, base, False)
+                        elif base <= ack_num:
+                            dup_acks = 0
+                            reset_backoff(rtt)
+                            if use_cc:
+                                cc_on_ack(cc, ack_num - base + 1)
+                            #The ACK is measured against the packet it acknowledges
+                            if ack_num not in resent and ack_num in send_times:
+                                update_rtt(rtt, time.time() - send_times[ack_num], metrics)
+                            #This loop is responsible for updating the sender's window 
+                            #after receiving an acknowledgment from the server. It ensures 
+                            #that the window is moved forward appropriately, acknowledging all the 
+                            #packets that have been successfully received by the server up 
+                            #to a certain sequence number.
+                            while base <= ack_num:
+                                window.pop(base, None)
+                                send_times.pop(base, None)
+                                resent.discard(base)
+                                base += 1
+                            #Restarting the timer for the new oldest packet
+                            timer_start = time.time()
+                except socket.timeout:
+                    #Handle the case where the ACK is not received and we have reached the timeout
+                    now = time.time()
+                    #We only woke up to send the next paced packet
+                    if now < deadline or not window:
+                        continue
+                    metrics['timeouts'] += 1
+                    #The server has stopped answering, or has forgotten the connection. A network
+                    #that only loses many packets still gets some ACKs through now and then
+                    if rtt['backoffs'] >= MAX_TIMEOUTS:
+                        failed = "No answer from the server after {} timeouts in a row, giving up the transfer".format(rtt['backoffs'])
+                        break
+                    if arq == 'sr':
+                        #In Selective Repeat we'll only resend the packets whose own timer has expired
+                        while timers and timers[0][0] + rtt['rto'] <= now:
+                            sent_time, seq = timers.popleft()
+                            if send_times.get(seq) != sent_time:
+                                continue
+                            if trace:
+                                print(f"{timestamp()} -- Resending packet with seq = {seq}")
+                            resend(seq)
+                        if batch is not None:
+                            batch.flush()
+                        #The acknowledged packets are never resent, so they can be forgotten
+                        resent.intersection_update(window)
+                    else:
+                        #This loop handles the retransmission of packets that have not been acknowledged 
+                        #by the server. It is triggered when the timeout occurs, indicating that the server
+                        #may not have received one or more packets, or the ACKs for those packets were lost.
+                        #This is the last component of the Go-Back-N where we resend all packets from the 
+                        #last acknowledged packet to ensure reliable delivery if a timeout occurs.
+                        for seq in range(base, next_seq_num):
+                            #Resend all packets in the window
+                            if trace:
+                                print(f"{timestamp()} -- Resending packet with seq = {seq}")
+                            resend(seq)
+                        if batch is not None:
+                            batch.flush()
+                        timer_start = now
+                    backoff_rto(rtt)
+                    #A timeout is a strong sign of congestion, so the window starts over from 1
+                    if use_cc:
+                        cc_on_loss(cc, next_seq_num - base, next_seq_num, base, True)
+
+                #Hashing the acknowledged data for the digest, and then letting the
+                #system drop the pages of the file that are acknowledged and hashed
+                done = min((base - 1) * payload_size, len(view))
+                if digest is not None and done - hashed >= DIGEST_CHUNK:
+                    digest.update(view[hashed:done])
+                    hashed = done
+                if digest is not None:
+                    done = hashed
+                if mm is not None and map_offset + done - released >= RELEASE_CHUNK:
+                    released = release_pages(mm, released, map_offset + done)
+
+                #Writing how the transfer is going every stats_interval seconds
+                if stats_interval and time.time() >= next_sample:
+                    next_sample += stats_interval
+                    metrics['bytes'] = min((base - 1) * payload_size, len(view))
+                    if stream is not None:
+                        metrics['compressed_bytes'] = metrics['bytes']
+                        metrics['bytes'] = stream.raw_position(metrics['bytes'])
+                    emit(stats, snapshot(metrics, **transfer_state(rtt, cc, next_seq_num - base)))
+            #All of the file is acknowledged, unless we gave up
+            if failed is None:
+                metrics['bytes'] = len(view)
+                if stream is not None:
+                    metrics['bytes'] = stream.raw_read
+                    metrics['compressed_bytes'] = stream.produced
+                    log(verbosity, INFO, "{} bytes were sent as {} bytes with {}".format(stream.raw_read, stream.produced, compression))
+                    if version == 3:
+                        file_digest = stream.digest.hexdigest()
+                if digest is not None:
+                    digest.update(view[hashed:])
+                    file_digest = digest.hexdigest()
+
+    finally:
+        #Stopping the compressor, if it is still running because something went wrong
+        if stream is not None:
+            await stream.close()
+        #When all the packets is sent, we'll have to tear down the connection
+        log(verbosity, INFO, "\nConnection Teardown:")
+        #First off we'll  send a FIN packet to indicate that the connection termination
+        #We'll have to wait for a FIN-ACK from the server that will ensure us that
+        #the server has received our teardown request. The FIN can be lost as well,
+        #so we'll send it again with the same backoff as the data packets
+        fin_ack_flags = 0
+        fin_data = json.dumps({'digest': file_digest}).encode() if file_digest else b''
+        #The server tells in the FIN-ACK if its file has the same digest as ours
+        verified = None
+        if failed is not None:
+            print(failed)
+        else:
+            for attempt in range(FIN_RETRIES):
+                sock.send(create_packet(next_seq_num, 0, FIN, fin_data, version))
+                log(verbosity, INFO, "FIN packet sent")
+                #ACKs for data packets that were on their way, and damaged packets, can arrive
+                #before the FIN-ACK. They are skipped without sending the FIN again, until the RTO has passed
+                deadline = time.time() + rtt['rto']
+                try:
+                    while True:
+                        #Receiving the fin-ack packet from server
+                        fin_ack_packet = await receive(sock, max(deadline - time.time(), 0))
+                        #Parsing the fin-ack packet so we can extract
+                        #the fin-ack flags to make sure that they're correct.
+                        parsed = parse_checked(fin_ack_packet) if version == 3 else parse_packet(fin_ack_packet, version)
+                        _, _, fin_ack_flags, fin_ack_data = parsed or (0, 0, 0, b'')
+                        if parsed is None:
+                            metrics['corrupt_packets'] += 1
+                        elif fin_ack_flags & (FIN | RST):
+                            break
+                except socket.timeout:
+                    backoff_rto(rtt)
+                    continue
+                if fin_ack_data:
+                    verified = json.loads(bytes(fin_ack_data)).get('verified')
+                break
+            else:
+                print("No FIN-ACK received, closing anyway")
+        if fin_ack_flags & RST:
+            print("The server has given up the connection")
+        #Check if the received packet is a FIN-ACK
+        metrics['end'] = time.time()
+        metrics['verified'] = verified
+        if verified is False:
+            print("The file the server saved is not the same as {}, it was damaged on the way".format(file_name))
+        if fin_ack_flags & FIN:
+            log(verbosity, INFO, "FIN ACK packet received")
+            if verified and sent_part is not None:
+                log(verbosity, INFO, "The server has checked that the {} bytes we sent from byte {} have the same SHA-256 digest as ours".format(*sent_part))
+            elif verified:
+                log(verbosity, INFO, "The server has checked that its file has the same SHA-256 digest as ours")
+            #Printing the round trip time estimates and the resulting RTO
+            if rtt['srtt'] is not None:
+                log(verbosity, INFO, "\nRTT = {:.3f} ms, RTT variance = {:.3f} ms, RTO = {:.3f} ms".format(rtt['srtt'] * 1000, rtt['rttvar'] * 1000, rtt['rto'] * 1000))
+            log(verbosity, INFO, "Retransmitted packets = {}".format(metrics['retransmissions']))
+            if use_cc:
+                #Showing how the congestion window changed during the transfer
+                log(verbosity, INFO, "cwnd = {:.1f}, largest cwnd = {:.1f}, ssthresh = {:.1f}".format(cc['cwnd'], cc['max_cwnd'], cc['ssthresh']))
+                log(verbosity, INFO, "cwnd after each loss (seconds, cwnd) = {}".format(cc['trace']))
+            log(verbosity, INFO, "\nConnection Closes")
+        #The last snapshot of the metrics, which also tells if the server got all of the file
+        completed = bool(fin_ack_flags & FIN) and verified is not False
+        emit(stats, snapshot(metrics, final=True, completed=completed, cwnd_trace=cc['trace'],
+                             **transfer_state(rtt, cc, next_seq_num - base)))
+        #Closing the socket on a reliable way, and the file
+        resources.close()
+    return completed
+
+#The files to send. A directory stands for all the files in it
+def find_files(file_names):
+    files = []
+    for name in file_names:
+        if os.path.isdir(name):
+            files.extend(os.path.join(name, entry) for entry in sorted(os.listdir(name)) if os.path.isfile(os.path.join(name, entry)))
+        else:
+            files.append(name)
+    return files
+
+#Sending many files at the same time, at most parallel of them at once, so their
+#handshakes and round trips overlap instead of coming one after the other
+async def send_files(file_names, server_address, parallel=PARALLEL_TRANSFERS, **options):
+    limit = asyncio.Semaphore(parallel)
+    #All the files share the rate limit, so together they don't send faster than it
+    if options.get('rate'):
+        options['limiter'] = new_bucket(options['rate'] * 1000000 / 8)
+
+    async def send_one(file_name):
+        async with limit:
+            try:
+                return await send_file(file_name, server_address, **options)
+            except OSError as e:
+                print("Sending {} failed: {}".format(file_name, e))
+                return False
+
+    start = time.time()
+    results = await asyncio.gather(*(send_one(file_name) for file_name in file_names))
+    elapsed = time.time() - start
+    sent = sum(os.path.getsize(name) for name, ok in zip(file_names, results) if ok)
+    print("\nSent {} of {} files ({} bytes) in {:.2f} seconds".format(sum(results), len(file_names), sent, elapsed))
+    for name, ok in zip(file_names, results):
+        if not ok:
+            print("Not sent: {}".format(name))
+    return all(results)
+
+#Splitting a file of size bytes into byte ranges (offset, length), one for each stripe.
+#All the ranges except the last one are a whole number of packets, so every packet is full
+def stripe_ranges(size, stripes, payload_size):
+    packets = (size + payload_size - 1) // payload_size
+    packets_per_stripe = max((packets + stripes - 1) // stripes, 1)
+    ranges = []
+    offset = 0
+    while offset < size or not ranges:
+        length = min(packets_per_stripe * payload_size, size - offset)
+        ranges.append((offset, length))
+        offset += length
+    return ranges
+
+#Sending one stripe of a file in a process of the pool. name is the file the
+#server saves the first stripe in, and the other stripes join it
+def send_stripe(file_name, server_address, offset, length, name, options):
+    return asyncio.run(send_file(file_name, server_address, offset=offset, length=length,
+                                 extra_options={'name': name, 'join': True}, **options))
+
+#Sending a large file as stripes over many connections at the same time, each
+#in its own process so they aren't held back by one Python thread and one window.
+#The first stripe is sent by this process. When it is connected, the server has
+#picked the file to save it in, and the other stripes are started in the pool and told
+#to join that file. The server puts every stripe at its place in the file
+def send_striped(file_name, server_address, stripes, options):
+    size = os.path.getsize(file_name)
+    ranges = stripe_ranges(size, stripes, options['payload_size'])
+    #The stripes are sent by different processes, so each of them gets its share of the rate limit
+    if options.get('rate'):
+        options = dict(options, rate=options['rate'] / len(ranges))
+    log(options.get('verbosity', INFO), INFO, "Sending {} in {} stripes".format(file_name, len(ranges)))
+    start = time.time()
+    #The pool is made before the event loop runs, since its processes are copies of this one
+    with multiprocessing.Pool(max(len(ranges) - 1, 1)) as pool:
+        results = []
+
+        def start_stripes(server_options):
+            for offset, length in ranges[1:]:
+                results.append(pool.apply_async(send_stripe, (file_name, server_address, offset, length, server_options.get('name'), options)))
+
+        offset, length = ranges[0]
+        first = asyncio.run(send_file(file_name, server_address, offset=offset, length=length,
+                                      extra_options={'stripes': len(ranges)}, on_connect=start_stripes, **options))
+        #Waiting for all the stripes, also when one of them failed
+        others = [result.get() for result in results]
+    elapsed = time.time() - start
+    if first and len(others) == len(ranges) - 1 and all(others):
+        print("\nSent {} bytes in {} stripes in {:.2f} seconds ({:.2f} Mbps)".format(size, len(ranges), elapsed, size * 8 / (max(elapsed, 1e-9) * 1000000)))
+        return True
+    print("\nSending {} in stripes failed".format(file_name))
+    return False
+
+def main(server_ip, server_port, file_names, window_size, arq='gbn', dup_ack_threshold=DUP_ACK_THRESHOLD, congestion_control='none',
+         payload_size=None, probe=False, batching=True, parallel=PARALLEL_TRANSFERS, stripes=1, verbosity=INFO, stats=None, stats_interval=0,
+         compression=None, compression_level=None, pace=False, rate=None):
+    #Defining the server address and port
+    server_address = (server_ip, server_port)
+    if isinstance(file_names, str):
+        file_names = [file_names]
+    files = find_files(file_names or [])
+    if not files:
+        print("No files to send")
+        return
+
+    #If we are asked to, we'll find the largest packet that gets through to the
+    #server before we connect, and use it as the size of our packets
+    payload_size = min(payload_size or PAYLOAD_SIZE, MAX_PAYLOAD)
+    if probe:
+        payload_size = probe_payload_size(server_address, payload_size)
+
+    options = {'window_size': window_size, 'arq': arq, 'dup_ack_threshold': dup_ack_threshold,
+               'congestion_control': congestion_control, 'payload_size': payload_size, 'batching': batching,
+               'verbosity': verbosity, 'stats': stats, 'stats_interval': stats_interval,
+               'compression': compression, 'compression_level': compression_level, 'pace': pace, 'rate': rate}
+    if len(files) == 1 and stripes > 1:
+        send_striped(files[0], server_address, stripes, options)
+    elif len(files) == 1:
+        asyncio.run(send_file(files[0], server_address, **options))
+    else:
+        asyncio.run(send_files(files, server_address, parallel, **options))
+
+#A client that other programs can use without going through application.py. It keeps the
+#address of the server and the options of the transfers, which are the same as for
+#send_file, so every file is sent the same way. send() runs an event loop of its own,
+#and send_async() is for programs that already have one. Both return True when the
+#server has all of the file
+class Sender:
+    def __init__(self, server_address, window_size=3, verbosity=QUIET, **options):
+        self.server_address = server_address
+        self.options = dict(options, window_size=window_size, verbosity=verbosity)
+
+    async def send_async(self, file_name, **options):
+        return await send_file(file_name, self.server_address, **dict(self.options, **options))
+
+    def send(self, file_name, **options):
+        return asyncio.run(self.send_async(file_name, **options))
+
+    #Sending many files at the same time, like send_files
+    def send_many(self, file_names, parallel=PARALLEL_TRANSFERS):
+        return asyncio.run(send_files(find_files(file_names), self.server_address, parallel, **self.options))
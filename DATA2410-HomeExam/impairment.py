@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import random
+import signal
+import socket
+
+#A UDP proxy that makes the network between the client and the server worse on
+#purpose, so the protocol can be tested and measured on a bad network on one machine.
+#The client sends to the proxy, and the proxy sends the packets on to the server and
+#the answers back to the client. On the way, in both directions, packets can be lost,
+#delayed, reordered, duplicated, damaged and held back by a bandwidth limit.
+#All the random choices come from seeded generators, so a run can be repeated.
+#
+#Example, 1% loss and 20 ms round trip time in front of a server on port 8989:
+#    python3 impairment.py -i 127.0.0.1 -p 8989 -l 9000 --loss 0.01 --delay 10
+#    python3 application.py -c -i 127.0.0.1 -p 9000 -f photo.jpg
+
+#How long a client can be quiet before its socket to the server is closed
+IDLE_TIMEOUT = 60
+
+#One direction of the traffic (client to server or server to client). It has its own
+#random numbers, bandwidth queue and counters, so the two directions don't affect each other
+class Link:
+    def __init__(self, name, config, seed):
+        self.name = name
+        self.config = config
+        self.random = random.Random(seed)
+        #When the bandwidth limit lets the next packet out
+        self.busy_until = 0.0
+        self.counters = {'packets': 0, 'lost': 0, 'duplicated': 0, 'reordered': 0, 'corrupted': 0, 'queue_drops': 0}
+
+    #Passing the packet on with deliver(data), or not
+    def send(self, data, deliver):
+        config = self.config
+        self.counters['packets'] += 1
+        if config.loss and self.random.random() < config.loss:
+            self.counters['lost'] += 1
+            return
+        #A damaged packet gets one of its bits flipped, which the UDP checksum would
+        #usually catch on a real network, but not always
+        if config.corrupt and data and self.random.random() < config.corrupt:
+            self.counters['corrupted'] += 1
+            damaged = bytearray(data)
+            damaged[self.random.randrange(len(damaged))] ^= 1 << self.random.randrange(8)
+            data = bytes(damaged)
+        copies = 1
+        if config.duplicate and self.random.random() < config.duplicate:
+            self.counters['duplicated'] += 1
+            copies = 2
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        for _ in range(copies):
+            wait = 0.0
+            if config.rate:
+                #The packet has to wait for the packets in front of it in the queue. When the
+                #queue is longer than the limit the packet is dropped, like in a router
+                start = max(now, self.busy_until)
+                if start - now > config.queue / 1000:
+                    self.counters['queue_drops'] += 1
+                    continue
+                self.busy_until = start + len(data) * 8 / (config.rate * 1000000)
+                wait = self.busy_until - now
+            wait += max(config.delay + self.random.uniform(-config.jitter, config.jitter), 0) / 1000
+            #A reordered packet is held back a little longer, so the packets after it overtake it
+            if config.reorder and self.random.random() < config.reorder:
+                self.counters['reordered'] += 1
+                wait += config.reorder_delay / 1000
+            if wait > 0:
+                loop.call_later(wait, deliver, data)
+            else:
+                deliver(data)
+
+#The proxy. Every client gets its own socket to the server, so the server sees
+#the clients as different addresses just like without the proxy
+class Proxy:
+    def __init__(self, listen_address, server_address, config):
+        self.server_address = server_address
+        self.up = Link('client -> server', config, config.seed * 2)
+        self.down = Link('server -> client', config, config.seed * 2 + 1)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(listen_address)
+        self.sock.setblocking(False)
+        #The sockets to the server, found by the address of the client, and when they were last used
+        self.upstreams = {}
+        self.last_used = {}
+
+    def start(self, loop):
+        self.loop = loop
+        loop.add_reader(self.sock.fileno(), self.from_client)
+        loop.call_later(IDLE_TIMEOUT, self.close_idle)
+
+    #Packets from the clients are sent on to the server
+    def from_client(self):
+        while True:
+            try:
+                data, client = self.sock.recvfrom(65535)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            upstream = self.upstreams.get(client)
+            if upstream is None:
+                upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                upstream.connect(self.server_address)
+                upstream.setblocking(False)
+                self.loop.add_reader(upstream.fileno(), self.from_server, upstream, client)
+                self.upstreams[client] = upstream
+            self.last_used[client] = self.loop.time()
+            self.up.send(data, lambda data, upstream=upstream: send_quietly(upstream.send, data))
+
+    #Packets from the server are sent back to the client they belong to
+    def from_server(self, upstream, client):
+        while True:
+            try:
+                data = upstream.recv(65535)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            self.down.send(data, lambda data: send_quietly(self.sock.sendto, data, client))
+
+    #Closing the sockets of the clients we haven't heard from in a while
+    def close_idle(self):
+        now = self.loop.time()
+        for client, last_used in list(self.last_used.items()):
+            if now - last_used > IDLE_TIMEOUT:
+                upstream = self.upstreams.pop(client)
+                del self.last_used[client]
+                self.loop.remove_reader(upstream.fileno())
+                upstream.close()
+        self.loop.call_later(IDLE_TIMEOUT, self.close_idle)
+
+    def print_counters(self):
+        for link in (self.up, self.down):
+            print("{}: {}".format(link.name, ", ".join("{} {}".format(name.replace('_', ' '), count) for name, count in link.counters.items())))
+
+#A packet that can't be sent (the send buffer is full or the server isn't there)
+#is lost, just like on a real network
+def send_quietly(send, *args):
+    try:
+        send(*args)
+    except OSError:
+        pass
+
+async def run(proxy):
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    #Stopping on Ctrl+C or kill, and printing what the proxy has done
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+    proxy.start(loop)
+    await stop
+    proxy.print_counters()
+
+def main():
+    parser = argparse.ArgumentParser(description='UDP proxy that adds loss, delay, jitter, reordering, duplication and a bandwidth limit')
+    parser.add_argument('-i', '--serverIP', default='127.0.0.1', help='The IP address of the server')
+    parser.add_argument('-p', '--serverPort', type=int, required=True, help='The port of the server')
+    parser.add_argument('-l', '--listen', type=int, required=True, help='The port the clients send to')
+    parser.add_argument('--bind', default='127.0.0.1', help='The IP address the clients send to')
+    parser.add_argument('--loss', type=float, default=0, help='Share of the packets that are lost (0.01 is 1%%)')
+    parser.add_argument('--delay', type=float, default=0, help='Delay in ms in each direction (the RTT is twice this)')
+    parser.add_argument('--jitter', type=float, default=0, help='The delay varies this many ms up or down')
+    parser.add_argument('--reorder', type=float, default=0, help='Share of the packets that are held back so later packets overtake them')
+    parser.add_argument('--reorder-delay', type=float, default=10, help='How many ms a reordered packet is held back')
+    parser.add_argument('--corrupt', type=float, default=0, help='Share of the packets that get one bit flipped')
+    parser.add_argument('--duplicate', type=float, default=0, help='Share of the packets that arrive twice')
+    parser.add_argument('--rate', type=float, default=0, help='Bandwidth limit in Mbit/s in each direction (0 for no limit)')
+    parser.add_argument('--queue', type=float, default=100, help='With a bandwidth limit, packets that would wait longer than this many ms are dropped')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the random choices')
+    args = parser.parse_args()
+
+    proxy = Proxy((args.bind, args.listen), (args.serverIP, args.serverPort), args)
+    print("Forwarding {}:{} to {}:{}".format(args.bind, args.listen, args.serverIP, args.serverPort), flush=True)
+    asyncio.run(run(proxy))
+
+if __name__ == '__main__':
+    main()